@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Compare strided netcdf reads of the temperature record with ReadPlan reads
+
+For a range of grid spacings, reports the bytes of the model window that
+are used, the bytes of chunks that are decompressed to read them, and the
+wall time of reading the whole record with a plain strided slice and with
+a ReadPlan.
+
+Usage: python benchmarks/read_planner.py [netcdf file]
+"""
+import sys
+import time
+
+from netCDF4 import Dataset
+
+from cru_alaska_temperature.alaska_temperature import data_directory
+from cru_alaska_temperature.readers import ReadPlan
+
+
+def time_read(read, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(nc_filename):
+    with Dataset(nc_filename) as nc_file:
+        temp = nc_file.variables["temp"]
+        nt, ny, nx = temp.shape
+        default_cache = temp.get_var_chunk_cache()
+        print(f"{nc_filename}: shape {temp.shape}, chunks {temp.chunking()}")
+        print(
+            f"{'skip':>4} {'MB used':>9} {'MB decomp':>10} {'ratio':>6}"
+            f" {'strided s':>10} {'planned s':>10}"
+        )
+        for skip in (1, 2, 4, 8):
+            window = (slice(0, ny, skip), slice(0, nx, skip))
+            plan = ReadPlan(temp, window)
+            used = plan.bytes_used(0, nt)
+            decompressed = sum(
+                plan.bytes_decompressed(t0, min(t0 + plan.months_per_read, nt))
+                for t0 in range(0, nt, plan.months_per_read)
+            )
+            planned = time_read(lambda: plan.read(0, nt))
+
+            temp.set_var_chunk_cache(*default_cache)
+            strided = time_read(lambda: temp[(slice(None),) + window])
+
+            print(
+                f"{skip:4d} {used / 2 ** 20:9.1f} {decompressed / 2 ** 20:10.1f}"
+                f" {decompressed / used:6.1f} {strided:10.3f} {planned:10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        nc_filename = sys.argv[1]
+    else:
+        nc_filename = data_directory / "cru_alaska_lowres_temperature.nc"
+    main(nc_filename)
@@ -0,0 +1,137 @@
+"""Benchmarks of AlaskaTemperature and AlaskaTemperatureBMI
+
+Run with pytest-benchmark, for example to save a baseline and later compare
+against it:
+
+    $ pytest benchmarks --benchmark-autosave
+    $ pytest benchmarks --benchmark-compare
+
+Grid sizes range from a single cell to the full extent of the lowres file.
+Besides wall time, each benchmark records in its extra_info the peak memory
+allocated by one call and the memory (and number of blocks) it left
+allocated, as measured by tracemalloc.
+"""
+import pathlib
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from cru_alaska_temperature import AlaskaTemperature, AlaskaTemperatureBMI
+from cru_alaska_temperature.alaska_temperature import (
+    data_directory,
+    examples_directory,
+)
+from cru_alaska_temperature.ensemble import set_oldstyle_config_values
+from cru_alaska_temperature.spatial import GridLocator
+
+with Dataset(data_directory / "cru_alaska_lowres_temperature.nc") as nc_file:
+    _, full_rows, full_columns = nc_file.variables["temp"].shape
+
+GRID_SHAPES = [(1, 1), (10, 10), (40, 20), (full_columns, full_rows)]
+
+
+def record_memory(benchmark, func, *args):
+    """Run func once under tracemalloc and save its memory use"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory_bytes"] = peak
+    benchmark.extra_info["retained_memory_bytes"] = current
+    benchmark.extra_info["retained_blocks"] = blocks
+
+
+@pytest.fixture(params=GRID_SHAPES, ids=lambda shape: f"{shape[0]}x{shape[1]}")
+def cfg_file(request, tmp_path):
+    columns, rows = request.param
+    path = pathlib.Path(tmp_path) / "benchmark.cfg"
+    path.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "default_temperature.cfg").read_text(),
+            {"i_ul": 0, "j_ul": 0, "grid_columns": columns, "grid_rows": rows},
+        )
+    )
+    return path
+
+
+@pytest.fixture
+def bmi(cfg_file):
+    bmi = AlaskaTemperatureBMI()
+    bmi.initialize(cfg_file=cfg_file)
+    yield bmi
+    bmi.finalize()
+
+
+def test_initialize(benchmark, cfg_file):
+    def initialize():
+        model = AlaskaTemperature()
+        model.initialize_from_config_file(cfg_file)
+        model.finalize()
+
+    record_memory(benchmark, initialize)
+    benchmark(initialize)
+
+
+def test_update(benchmark, bmi):
+    def update():
+        # Start over at the end of the run, so every round takes one step
+        if bmi.get_current_time() >= bmi.get_end_time():
+            bmi._model._current_date = bmi._model.first_date
+        bmi.update()
+
+    record_memory(benchmark, update)
+    benchmark(update)
+
+
+def test_update_until_end(benchmark, bmi):
+    def update_until_end():
+        bmi._model._current_date = bmi._model.first_date
+        bmi.update_until(bmi.get_end_time())
+
+    record_memory(benchmark, update_until_end)
+    benchmark(update_until_end)
+
+
+def test_get_value(benchmark, bmi):
+    name = "atmosphere_bottom_air__temperature"
+    out = np.empty(bmi.get_grid_size(bmi.get_var_grid(name)), dtype=np.float32)
+    record_memory(benchmark, bmi.get_value, name, out)
+    benchmark(bmi.get_value, name, out)
+
+
+def test_get_value_ref(benchmark, bmi):
+    name = "atmosphere_bottom_air__temperature"
+    record_memory(benchmark, bmi.get_value_ref, name)
+    benchmark(bmi.get_value_ref, name)
+
+
+def test_get_values(benchmark, bmi):
+    names = bmi.get_output_var_names()
+    out = bmi.get_values(names)
+    record_memory(benchmark, bmi.get_values, names, out)
+    benchmark(bmi.get_values, names, out)
+
+
+def test_locate_pan_arctic(benchmark):
+    # Cells of a 0.5 degree grid converge towards the pole
+    lon, lat = np.meshgrid(np.arange(-179.75, 180.0, 0.5), np.arange(45.25, 90.0, 0.5))
+    locator = GridLocator(lat, lon)
+    rng = np.random.default_rng(0)
+    points_lat = np.degrees(np.arcsin(rng.uniform(np.sin(np.radians(45.0)), 1.0, 100000)))
+    points_lon = rng.uniform(-180.0, 180.0, 100000)
+    record_memory(benchmark, locator.nearest, points_lat, points_lon)
+    benchmark(locator.nearest, points_lat, points_lon)
+
+
+def test_import(benchmark):
+    # Each round imports the package into a fresh interpreter
+    command = [sys.executable, "-c", "import cru_alaska_temperature"]
+    benchmark(subprocess.run, command, check=True)
@@ -8,24 +8,48 @@ from __future__ import print_function
 import calendar
 import datetime as dt
 import pathlib
+import time
 
 import numpy as np
-import pkg_resources
-import yaml
-from dateutil.relativedelta import relativedelta
 
-# Using netcdf3
-# from scipy.io.netcdf import NetCDFFile as Dataset
-# Using netcdf4
-from netCDF4 import Dataset
-
-data_directory = pathlib.Path(pkg_resources.resource_filename(
-    "cru_alaska_temperature", "data")
+from . import cache
+from .config import is_yes, load_config, read_oldstyle_options
+from .multifile import open_temperature_dataset, temperature_filenames
+from .profiling import Profiler, profiled
+from .readers import (
+    ReadPlan,
+    StreamingTemperatureReader,
+    detect_layout,
+    read_site_series,
 )
-examples_directory = pathlib.Path(
-    pkg_resources.resource_filename("cru_alaska_temperature", "examples")
+from .spatial import GridLocator, nearest_cells
+from .storage import STORAGE_MODES, PackedTemperature, pack_temperature
+from .store import shared_store
+from .writers import open_output_writer
+
+# The package's data files are found next to this module.  netCDF4 and yaml
+# are slow to import, so they are only imported when first used
+data_directory = pathlib.Path(__file__).parent / "data"
+examples_directory = pathlib.Path(__file__).parent / "examples"
+
+# Output grids of every run, and those added by "climate_outputs | yes"
+output_grid_names = ("T_air", "T_air_prior_jan", "T_air_prior_jul", "T_air_prior_year")
+climate_output_grid_names = (
+    "T_air_climatology",
+    "T_air_anomaly",
+    "FDD_prior_year",
+    "TDD_prior_year",
 )
 
+# The temperature file of each (run_region, run_resolution), within the data
+# directory.  The highres files are the full-resolution CRU NCEP data
+temperature_files = {
+    ("Alaska", "lowres"): "cru_alaska_lowres_temperature.nc",
+    ("Alaska", "highres"): "cru_alaska_highres_temperature.nc",
+    ("PanArctic", "lowres"): "cru_panarctic_lowres_temperature.nc",
+    ("PanArctic", "highres"): "cru_panarctic_highres_temperature.nc",
+}
+
 
 def in_bounds_or_raise(value, minval=None, maxval=None):
     """Check if a value is in bounds, otherwise raise an error
@@ -49,9 +73,18 @@ def in_bounds_or_raise(value, minval=None, maxval=None):
     Traceback (most recent call last):
     ...
     ValueError: value must be at least 0 (-1)
+
+    Arrays are checked element by element.
+
+    >>> in_bounds_or_raise([0, 2], 0, 1)
+    Traceback (most recent call last):
+    ...
+    ValueError: value must be between 0 and 1 ([0 2])
     """
-    if (minval is not None and value < minval) or (
-        maxval is not None and value > maxval
+    if not np.isscalar(value) and not isinstance(value, dt.date):
+        value = np.asarray(value)
+    if (minval is not None and np.any(value < minval)) or (
+        maxval is not None and np.any(value > maxval)
     ):
         if maxval is None:
             message = f"value must be at least {minval} ({value})"
@@ -62,25 +95,90 @@ def in_bounds_or_raise(value, minval=None, maxval=None):
         raise ValueError(message)
 
 
+def read_site_file(site_filename):
+    """Read the latitude and longitude of sites from a text file
+
+    Each line holds a latitude and a longitude in degrees, separated by
+    whitespace or a comma.  Lines starting with '#' are ignored.
+
+    Returns
+    -------
+    tuple of ndarray
+        Latitudes and longitudes of the sites.
+    """
+    with open(site_filename, "r") as site_file:
+        lines = [
+            line.replace(",", " ")
+            for line in site_file
+            if line.strip() and not line.startswith("#")
+        ]
+    sites = np.loadtxt(lines, ndmin=2)
+    if sites.shape[1] != 2:
+        raise ValueError(f"site file must have two columns ({site_filename})")
+    return sites[:, 0], sites[:, 1]
+
+
 class AlaskaTemperature:
     def __init__(self):
         self._cru_temperature_nc_filename = None  # Name of input netcdf file
         self._cru_temperature_nc_filename_default = data_directory / "cru_ak_temp.nc"
         # Default name of input netcdf file
-        self._cru_temperature_ncfile = Dataset  # netCDF file handle
+        self._cru_temperature_ncfile = None  # netCDF file handle
         self._cru_temperature = None  # This will point to the nc file data
-        self._current_date = None  # Current num days since _start_date
+        self._time_index = None  # netcdf time index of the current month
+        self._time_index_at_timestep0 = None  # netcdf time index of timestep 0
+        self._day_index = None  # Days since timestep 0, for daily timesteps
+        self._day_time_index = None  # netcdf time index of each day
+        self._day_lower_index = None  # Monthly mean before each day
+        self._day_weight = None  # Weight of the monthly mean after each day
+        self._interpolation = "linear"  # How daily values are interpolated
+        self._knot_time_index = None  # Monthly mean that knots start from
+        self._knot_base = None  # Temperature at the earlier knot
+        self._knot_slope = None  # Temperature change to the later knot
         self._date_at_timestep0 = None  # this could be overwritten with set()
         self._latitude = None  # Will point to this model's latitude grid
         self._longitude = None  # Will point to this model's longitude grid
         self._temperature = None  # Will point to this model's temperature grid
         self.T_air = None  # Temperature grid
-        self.T_air_prior_months = None  # Temperature grid each prior 12 months
+        self._month_ring = None  # Temperature grid each calendar month
+        self._ring_time_index = None  # netcdf time index held in each month
+        self._ring_finite = None  # Whether each month of the ring has no NaN
+        self._prior_year_sum = None  # Running sum of the prior 12 months
         self.T_air_prior_jan = None  # Temperature grid prior January
         self.T_air_prior_jul = None  # Temperature grid prior July
         self.T_air_prior_year = None  # Temperature grid average prior 12 months
+        self.T_air_climatology = None  # Mean temperature grid of current month
+        self.T_air_anomaly = None  # Temperature grid less its climatology
+        self.FDD_prior_year = None  # Freezing degree days prior 12 months
+        self.TDD_prior_year = None  # Thawing degree days prior 12 months
+        self._climatology = None  # Mean temperature grid of each calendar month
+        self._climatology_years = None  # First and last year of the climatology
+        self._ring_days = None  # Number of days of the month in each ring slot
+        self._prior_year_fdd = None  # Running freezing degree days
+        self._prior_year_tdd = None  # Running thawing degree days
+        self._degree_days = None  # Degree days of one month of the ring
+        self._climate_outputs = False  # Output climatology and degree days too
+        self._output_grid_names = output_grid_names  # Names of the output grids
+        self._output_grids = None  # Output grids stacked in one array
         self._time_units = "years"  # Timestep is in years
         self._timestep_duration = 0
+        self._read_mode = "eager"  # "eager" or "streaming" temperature reads
+        self._read_ahead_months = 12  # Extra months read per streaming read
+        self._prefetch = False  # Read the next streaming block in the background
+        self._storage = "float32"  # How the temperature record is held in memory
+        self._output_writer = None  # Writes the output grids at each timestep
+        self._profiler = Profiler()  # Timers and counters, off by default
+        self._nc_layout = None  # "map" or "timeseries" chunking of the file
+        self._precompute = False  # Compute outputs for all timesteps at once
+        self._series = None  # Precomputed output grids for each timestep
+        self._series_time_index = None  # netcdf time index of each timestep
+        self._use_shared_store = False  # Share temperatures between instances
+        self._store_key = None  # Key of _temperature in the shared store
+        self._cache_directory = None  # Where decoded netcdf data are cached
+        self._site_file = None  # File of site latitudes and longitudes
+        self._site_j = None  # netcdf row of each site
+        self._site_i = None  # netcdf column of each site
+        self._locator = None  # Spatial index of the model's cells
 
         # The following are defined in config file
         self.cfg_file = ""
@@ -95,7 +193,6 @@ class AlaskaTemperature:
         self._nc_jskip = 0
         self._first_valid_date = dt.date(2000, 1, 1)
         self._last_valid_date = dt.date(1900, 1, 1)
-        self._current_timestep = 0.0
         self._first_timestep = 0.0
         self._last_timestep = 0.0
         self.first_date = dt.date(1900, 1, 1)
@@ -147,71 +244,12 @@ class AlaskaTemperature:
             raise ValueError(f"bad shape for grid ({cfg['grid_shape']})")
 
     def get_config_from_oldstyle_file(self, cfg_filename):
-        cfg_struct = {}
-        grid_struct = {}
-        with open(cfg_filename, "r") as cfg_file:
-            # this is based loosely on read_config_file in BMI_base.py
-            while True:
-                # Read lines from config file until no more remain
-                line = cfg_file.readline()
-                if line == "":
-                    break
-
-                # Comments start with '#'
-                COMMENT = line[0] == "#"
-
-                words = line.split("|")
-                if (len(words) == 4) and (not COMMENT):
-                    var_name = words[0].strip()
-                    value = words[1].strip()
-                    var_type = words[2].strip()
-
-                    # Process the variables based on variable name
-                    if var_name[-4:] == "date":
-                        # date variables end with "_date"
-                        cfg_struct[var_name] = dt.datetime.strptime(
-                            value, "%Y-%m-%d"
-                        ).date()
-                    elif var_name[0:4] == "grid":
-                        # grid variables are processed after cfg file read
-                        grid_struct[var_name] = value
-                    elif var_name == "timestep":
-                        # timestep is now a number of years
-                        cfg_struct[var_name] = int(value)
-                    elif var_type == "int":
-                        # Convert integers to int
-                        cfg_struct[var_name] = int(value)
-                    elif var_type == "long":
-                        # Convert longs to int
-                        cfg_struct[var_name] = int(value)
-                    else:
-                        # Everything else is just passed as a string
-                        cfg_struct[var_name] = value
-
-        """
-        print(" ")
-        for key in cfg_struct.keys():
-            print("%s: %s" % (str(key), str(cfg_struct[key])))
-
-        exit(0)
-        """
-
-        # After reading the files, process the grid_struct values
-        cfg_struct["grid_shape"] = (
-            int(grid_struct["grid_columns"]),
-            int(grid_struct["grid_rows"]),
-        )
-        cfg_struct["grid_type"] = grid_struct["grid_type"]
-        cfg_struct["grids"] = {grid_struct["grid_name"]: "np.float"}
-
-        return cfg_struct
+        """Parse an old-style config file (see config.load_config)"""
+        return load_config(cfg_filename, style="oldstyle")
 
     def get_config_from_yaml_file(self, cfg_filename):
-        cfg_struct = None
-        with open(cfg_filename, "r") as cfg_file:
-            cfg_struct = yaml.load(cfg_file)
-
-        return cfg_struct
+        """Parse a YAML config file (see config.load_config)"""
+        return load_config(cfg_filename, style="yaml")
 
     def verify_run_type_parameters(self, cfg_struct):
         # There should be a separate verify_config_for_<gridtype>_run()
@@ -223,25 +261,52 @@ class AlaskaTemperature:
         # except:
         #     raise
 
-    def verify_temperature_netcdf_for_region_resolution(self, cfg_struct):
-        if (
-            cfg_struct["run_resolution"] == "lowres"
-            and cfg_struct["run_region"] == "Alaska"
-        ):
-            return data_directory / "cru_alaska_lowres_temperature.nc"
+    def verify_temperature_netcdf_for_region_resolution(
+        self, cfg_struct, cfg_directory="."
+    ):
+        """Path to the temperature netcdf file of a run
+
+        A temperature_file in the config overrides the file registered for
+        the run_region and run_resolution.  It may also be a glob pattern or
+        a manifest (.txt) of files that split the record in time, in which
+        case a list of files is returned.  Only the lowres Alaska file is
+        distributed with the package; the others must be downloaded into
+        the data directory or given as a temperature_file.  A relative
+        temperature_file is relative to cfg_directory.
+        """
+        if "temperature_file" in cfg_struct:
+            nc_filename = temperature_filenames(
+                pathlib.Path(cfg_directory) / cfg_struct["temperature_file"]
+            )
+            if isinstance(nc_filename, list):
+                # A record split across a glob pattern or manifest of files
+                return nc_filename
+        else:
+            key = (cfg_struct["run_region"], cfg_struct["run_resolution"])
+            try:
+                nc_filename = data_directory / temperature_files[key]
+            except KeyError:
+                raise ValueError(
+                    "Combination of run_region '%s' and run_resolution '%s' "
+                    "not recognized" % key
+                )
 
-        raise ValueError(
-            "Combination of run_region '%s' and run_resolution '%s' not recognized"
-            % (cfg_struct["run_region"], cfg_struct["run_resolution"])
-        )
+        if not nc_filename.is_file():
+            raise ValueError(
+                f"temperature netcdf file not found ({nc_filename}); "
+                "set temperature_file in the config file to its location"
+            )
+        return nc_filename
 
     def i_nc_from_i(self, i, inverse=False, check_bounds=False):
         """Convert model's i-index to cru file's index
-        Input: i  the i-coordinate of the model grid
+        Input: i  the i-coordinate of the model grid (a number or an array)
         Output: i_nc  the coordinate in the netcdf grid
         inverse: if True, reverse the Input and Output
         check_bounds: if True, verify that all values are valid
         """
+        if not np.isscalar(i):
+            i = np.asarray(i)
         if not inverse:
             check_bounds and in_bounds_or_raise(i, 0, self._grid_shape[0] - 1)
             i_nc = self._nc_i0 + i * self._nc_iskip
@@ -258,16 +323,18 @@ class AlaskaTemperature:
 
     def j_nc_from_j(self, j, inverse=False, check_bounds=False):
         """Convert model's j-index to cru file's index
-        Input: j  the j-coordinate of the model grid
+        Input: j  the j-coordinate of the model grid (a number or an array)
         Output: j_nc  the coordinate in the netcdf grid
-        inverse: if True, reverse the Input and Outpu
+        inverse: if True, reverse the Input and Output
         check_bounds: if True, verify that all values are valid
         """
+        if not np.isscalar(j):
+            j = np.asarray(j)
         if not inverse:
             check_bounds and in_bounds_or_raise(j, 0, self._grid_shape[1] - 1)
             j_nc = self._nc_j0 + j * self._nc_jskip
 
-            check_bounds and in_bounds_or_raise(j_nc, 0, self._nc_xdim)
+            check_bounds and in_bounds_or_raise(j_nc, 0, self._nc_ydim)
             return j_nc
         else:
             j_nc = j
@@ -276,6 +343,17 @@ class AlaskaTemperature:
             check_bounds and in_bounds_or_raise(j, 0, self._grid_shape[1] - 1)
             return j
 
+    def cells_from_lat_lon(self, lat, lon):
+        """Find the model cells nearest to geographic coordinates
+        Input: lat, lon  latitudes and longitudes in degrees (numbers or arrays)
+        Output: a tuple with the index of each cell along each model grid
+            axis, i.e. (j, i), or (site,) for a run at a list of sites
+        The spatial index of the model's cells is built on the first call
+        """
+        if self._locator is None:
+            self._locator = GridLocator(self._latitude, self._longitude)
+        return self._locator.nearest(lat, lon)
+
     def get_first_last_dates_from_nc(self):
         nc_time_var = self._cru_temperature_ncfile.variables["time"]
         nc_time_units = nc_time_var.getncattr("time_units").split()
@@ -307,6 +385,7 @@ class AlaskaTemperature:
                 pass
 
     def initialize_from_config_file(self, cfg_filename=None):
+        started = time.perf_counter()
         cfg_struct = None
 
         # Set the cfg file if it exists, otherwise, a default
@@ -315,37 +394,143 @@ class AlaskaTemperature:
             cfg_filename = examples_directory / "default_temperature.cfg"
 
         cfg_struct = self.get_config_from_oldstyle_file(cfg_filename)
+        if is_yes(cfg_struct.get("profile", "no")):
+            self._profiler.enabled = True
+
+        # An instance may be initialized again, for another domain or dates
+        self.clear_run_state()
 
         # Verify that the parameters are correct for the grid type
         self.verify_run_type_parameters(cfg_struct)
 
         # Get the temperature netcdf file name
         self._cru_temperature_nc_filename = self.verify_temperature_netcdf_for_region_resolution(
-            cfg_struct
+            cfg_struct, pathlib.Path(cfg_filename).parent
         )
 
         # Open the netcdf files
-        self._cru_temperature_ncfile = Dataset(
-            self._cru_temperature_nc_filename, "r", mmap=True
-        )
+        with self._profiler.phase("open_netcdf"):
+            self._cru_temperature_ncfile = open_temperature_dataset(
+                self._cru_temperature_nc_filename,
+                max_open_files=cfg_struct.get("max_open_files", 4),
+            )
         assert self._cru_temperature_ncfile is not None
 
         # Initialize the time variables
         # From config
         self._timestep_duration = cfg_struct["timestep"]
+        self._time_units = cfg_struct.get("timestep_units", "years")
+        if self._time_units not in ("years", "months", "days"):
+            raise ValueError(
+                f"timestep_units must be years, months or days ({self._time_units})"
+            )
+        self._interpolation = cfg_struct.get("interpolation", "linear")
+        if self._interpolation not in ("linear", "mean_preserving"):
+            raise ValueError(
+                "interpolation must be linear or mean_preserving "
+                f"({self._interpolation})"
+            )
 
-        # first_date and last_date are years from cfg file
-        self.first_date = dt.date(
-            cfg_struct["model_start_year"], self.month, self.day
+        # Optional settings for how temperatures are read from the file
+        self._read_mode = cfg_struct.get("temperature_read_mode", "eager")
+        self._read_ahead_months = cfg_struct.get("read_ahead_months", 12)
+        in_bounds_or_raise(self._read_ahead_months, minval=0)
+        self._prefetch = is_yes(cfg_struct.get("prefetch", "no"))
+        self._storage = cfg_struct.get("temperature_storage", "float32")
+        if self._storage not in STORAGE_MODES:
+            raise ValueError(
+                "temperature_storage must be float32, float16 or int16 "
+                f"({self._storage})"
+            )
+        self._precompute = is_yes(cfg_struct.get("precompute_outputs", "no"))
+        self._climate_outputs = is_yes(cfg_struct.get("climate_outputs", "no"))
+        self._output_grid_names = output_grid_names
+        if self._climate_outputs:
+            self._output_grid_names += climate_output_grid_names
+        self._use_shared_store = is_yes(
+            cfg_struct.get("shared_temperature_store", "no")
         )
+        self._cache_directory = cfg_struct.get("cache_directory", None)
+        if self._cache_directory is not None:
+            # Relative paths are relative to the config file
+            self._cache_directory = (
+                pathlib.Path(cfg_filename).parent / self._cache_directory
+            )
+        self._site_file = cfg_struct.get("site_file", None)
+        if self._site_file is not None:
+            # Relative paths are relative to the config file
+            self._site_file = pathlib.Path(cfg_filename).parent / self._site_file
+
+        # A file rechunked by the repack module reads best one way: maps of
+        # single months are streamed, full time series are read at once
+        self._nc_layout = detect_layout(self._cru_temperature_ncfile)
+        if self._read_mode == "auto":
+            if (
+                self._nc_layout == "map"
+                and not self._precompute
+                and self._site_file is None
+                and self._storage == "float32"
+            ):
+                self._read_mode = "streaming"
+            else:
+                self._read_mode = "eager"
+        if self._read_mode not in ("eager", "streaming"):
+            raise ValueError(
+                "temperature_read_mode must be eager, streaming or auto "
+                f"({self._read_mode})"
+            )
+        if self._precompute and self._read_mode == "streaming":
+            raise ValueError("precompute_outputs requires eager temperature reads")
+        if self._precompute and self._time_units != "years":
+            raise ValueError("precompute_outputs requires a timestep in years")
+        if self._site_file is not None and self._read_mode == "streaming":
+            raise ValueError("site_file requires eager temperature reads")
+        if self._prefetch and self._read_mode != "streaming":
+            raise ValueError("prefetch requires streaming temperature reads")
+        if self._storage != "float32" and self._read_mode == "streaming":
+            raise ValueError("temperature_storage requires eager temperature reads")
+        if self._storage != "float32" and self._precompute:
+            raise ValueError("precompute_outputs requires float32 temperature_storage")
+        self._output_file = cfg_struct.get("output_file", None)
+        if self._output_file is not None:
+            self._output_file = pathlib.Path(cfg_filename).parent / self._output_file
+        self._output_flush_steps = cfg_struct.get("output_flush_steps", 12)
+        in_bounds_or_raise(self._output_flush_steps, minval=1)
+
+        # first_date and last_date are years from cfg file
+        # Monthly and daily runs cover every month or day of those years
+        if self._time_units == "days":
+            first_day, last_day = dt.date(1, 1, 1), dt.date(1, 12, 31)
+        elif self._time_units == "months":
+            first_day, last_day = dt.date(1, 1, self.day), dt.date(1, 12, self.day)
+        else:
+            first_day = last_day = dt.date(1, self.month, self.day)
+        self.first_date = first_day.replace(year=cfg_struct["model_start_year"])
         # This could be set externally, eg by WMT
         if self._date_at_timestep0 is None:
             self._date_at_timestep0 = self.first_date
 
-        self.last_date = dt.date(cfg_struct["model_end_year"], self.month, self.day)
+        self.last_date = last_day.replace(year=cfg_struct["model_end_year"])
 
         self.get_first_last_dates_from_nc()
 
+        # Monthly climatologies are means over these years, by default the
+        # whole record
+        self._climatology_years = (
+            cfg_struct.get("climatology_first_year", self._first_valid_date.year),
+            cfg_struct.get("climatology_last_year", self._last_valid_date.year),
+        )
+        in_bounds_or_raise(
+            self._climatology_years,
+            self._first_valid_date.year,
+            self._last_valid_date.year,
+        )
+        if self._climatology_years[0] > self._climatology_years[1]:
+            raise ValueError(
+                "climatology_first_year must not be after climatology_last_year "
+                f"{self._climatology_years}"
+            )
+
         # Ensure that model dates are okay
         in_bounds_or_raise(
             self._date_at_timestep0, self._first_valid_date, self._last_valid_date
@@ -357,134 +542,363 @@ class AlaskaTemperature:
             self.last_date, self._first_valid_date, self._last_valid_date
         )
 
-        # Initial calculations, assuming units of days
-        self._current_date = self._date_at_timestep0
+        # Model time is kept as an index along the netcdf time axis, so
+        # that stepping through time is integer arithmetic
+        self._months_per_step = 1 if self._time_units == "months" else 12
+        self._time_index_at_timestep0 = self.get_time_index(
+            self._date_at_timestep0.month, self._date_at_timestep0.year
+        )
+        self._time_index = self._time_index_at_timestep0
+        if self._time_units == "days":
+            self.build_daily_interpolation()
+            self._day_index = 0
         self._first_timestep = self.timestep_from_date(self.first_date)
         self._last_timestep = self.timestep_from_date(self.last_date)
-        self._current_timestep = self._first_timestep
 
         # Allocate the grids
         self._grid_shape = cfg_struct["grid_shape"]
-        for g in cfg_struct["grids"]:
-            grid_assignment_string = "self.%s_grid = np.zeros(%s, dtype=%s)" % (
-                g,
-                self._grid_shape,
-                cfg_struct["grids"][g],
-            )
-            # (g, cfg_struct['grid_shape'], cfg_struct['grids'][g])
-            exec(grid_assignment_string)
+        for g, dtype in cfg_struct["grids"].items():
+            setattr(self, f"{g}_grid", np.zeros(self._grid_shape, dtype=dtype))
 
         # Set the netcdf offset arrays
         # This should eventually be done non-manually
         self._nc_i0 = cfg_struct["i_ul"]
         self._nc_j0 = cfg_struct["j_ul"]
-        try:
-            self._nc_iskip = cfg_struct["i_skip"]
-        except KeyError:
-            self._nc_iskip = 1
-        try:
-            self._nc_iskip = cfg_struct["j_skip"]
-        except KeyError:
-            self._nc_jskip = 1
+        self._nc_iskip = cfg_struct.get("i_skip", 1)
+        self._nc_jskip = cfg_struct.get("j_skip", 1)
 
         # Calculate the end points
         self._nc_i1 = self.i_nc_from_i(self._grid_shape[0])
         self._nc_j1 = self.j_nc_from_j(self._grid_shape[1])
 
-        # Read in the latitude and longitude arrays
-        nc_latitude = self._cru_temperature_ncfile.variables["lat"]
-        self._latitude = np.asarray(
-            nc_latitude[
-                self._nc_j0 : self._nc_j1 : self._nc_jskip,
-                self._nc_i0 : self._nc_i1 : self._nc_iskip,
-            ]
-        ).astype(np.float32)
-        nc_longitude = self._cru_temperature_ncfile.variables["lon"]
-        self._longitude = np.asarray(
-            nc_longitude[
-                self._nc_j0 : self._nc_j1 : self._nc_jskip,
-                self._nc_i0 : self._nc_i1 : self._nc_iskip,
-            ]
-        ).astype(np.float32)
+        window = (
+            slice(self._nc_j0, self._nc_j1, self._nc_jskip),
+            slice(self._nc_i0, self._nc_i1, self._nc_iskip),
+        )
 
-        # If the variables that point to the netcdfile's variables
-        # aren't independently closed, then a RuntimeWarning will be raised
-        # when the program ends or thenetcdf file is closed
-        nc_latitude = None
-        nc_longitude = None
+        # Read in the latitude and longitude arrays
+        if self._site_file is None:
+            self._latitude = self.read_nc_window("lat", window)
+            self._longitude = self.read_nc_window("lon", window)
 
         # Read initial data
-        # Set the temperature file data to a variable
-        # Note: This is probably fine for a small file, but it may not be
-        # the best way to read from files that are several GB in size
+        # In "eager" mode the whole record for the model domain is read
+        # at once, which is fine for the lowres file.  In "streaming" mode
+        # the netcdf file is kept open and only the months needed by
+        # update_temperature_values() are read, a block at a time
         nc_temperature = self._cru_temperature_ncfile.variables["temp"]
-        self._temperature = np.asarray(
-            nc_temperature[
-                :,
-                self._nc_j0 : self._nc_j1 : self._nc_jskip,
-                self._nc_i0 : self._nc_i1 : self._nc_iskip,
-            ]
-        ).astype(np.float32)
+        if self._site_file is not None:
+            # Only the cells nearest each site are read
+            self.read_sites(self._site_file)
+        elif self._read_mode == "streaming":
+            self._temperature = StreamingTemperatureReader(
+                nc_temperature,
+                window,
+                block_size=12 + self._read_ahead_months,
+                prefetch=self._prefetch,
+            )
+        elif self._use_shared_store:
+            # Instances reading the same data share one read-only copy
+            nc_filenames = self._cru_temperature_nc_filename
+            if not isinstance(nc_filenames, list):
+                nc_filenames = [nc_filenames]
+            self._store_key = (
+                tuple(str(pathlib.Path(name).resolve()) for name in nc_filenames),
+                cfg_struct["run_region"],
+                cfg_struct["run_resolution"],
+                tuple((w.start, w.stop, w.step) for w in window),
+                self._storage,
+            )
+            self._temperature = shared_store.acquire(
+                self._store_key,
+                lambda: pack_temperature(
+                    self.read_nc_window("temp", (slice(None),) + window),
+                    self._storage,
+                ),
+            )
+        else:
+            self._temperature = pack_temperature(
+                self.read_nc_window("temp", (slice(None),) + window), self._storage
+            )
         # Deduce the model xdim and ydim from the size of this array
         self._nc_tdim = nc_temperature.shape[0]
         self._nc_ydim = nc_temperature.shape[1]
         self._nc_xdim = nc_temperature.shape[2]
 
+        # If the variables that point to the netcdfile's variables
+        # aren't independently closed, then a RuntimeWarning will be raised
+        # when the program ends or thenetcdf file is closed
         nc_temperature = None
 
+        if self._climate_outputs:
+            # This reads the climatology years of the whole record
+            with self._profiler.phase("climatology"):
+                self.compute_climatology()
+
+        if self._precompute:
+            self.precompute_temperature_series()
+
+        # The output grids are allocated once and updated in place, so that
+        # references to them (e.g. through the BMI) stay valid.  They are
+        # rows of a single array so they can be copied out together
+        self._output_grids = np.empty(
+            (len(self._output_grid_names),) + tuple(self._temperature.shape[1:]),
+            dtype=np.float32,
+        )
+        for name in climate_output_grid_names:
+            setattr(self, name, None)
+        for row, name in enumerate(self._output_grid_names):
+            setattr(self, name, self._output_grids[row])
+        self._profiler.count_allocation(
+            "initialize_from_config_file", self._output_grids
+        )
+
         # Set the T_air values--which are the "model results--
         # from the _temperature[] grid--which is the full lowres dataset
         self.update_temperature_values()
 
-        # Close the netcdf file
-        # Note: this will need to change if reading larger files and
-        # accessing data from the files as time goes on
-        self._cru_temperature_ncfile.close()
-        self._cru_temperature_ncfile = None
+        if self._output_file is not None:
+            self._output_writer = open_output_writer(
+                self._output_file,
+                self._output_grid_names,
+                self._output_grids.shape[1:],
+                flush_steps=self._output_flush_steps,
+                time_units=self._time_units,
+            )
+            self._output_writer.append(self._current_timestep, self._output_grids)
+
+        # Close the netcdf file, unless temperatures are still to be read
+        if self._read_mode != "streaming":
+            self._cru_temperature_ncfile.close()
+            self._cru_temperature_ncfile = None
+
+        self._profiler.record(
+            "initialize_from_config_file", time.perf_counter() - started
+        )
+
+    def clear_run_state(self):
+        """Forget the values kept from one timestep to the next
+
+           The ring of recent months, the running sums, the precomputed
+           series, the daily interpolation knots and the spatial index all
+           describe the domain and dates of the last initialization.
+        """
+        self._month_ring = None
+        self._ring_time_index = None
+        self._ring_finite = None
+        self._ring_days = None
+        self._prior_year_sum = None
+        self._prior_year_fdd = None
+        self._prior_year_tdd = None
+        self._degree_days = None
+        self._climatology = None
+        self._series = None
+        self._series_time_index = None
+        self._knot_time_index = None
+        self._knot_base = None
+        self._knot_slope = None
+        self._locator = None
+
+    def read_sites(self, site_filename):
+        """Read temperatures of the cells nearest a list of sites
+
+        The model grid becomes one node per site, in the order of the
+        site file.
+        """
+        site_lat, site_lon = read_site_file(site_filename)
+
+        nc_variables = self._cru_temperature_ncfile.variables
+        nc_lat = np.asarray(nc_variables["lat"][:])
+        nc_lon = np.asarray(nc_variables["lon"][:])
+        self._site_j, self._site_i = nearest_cells(nc_lat, nc_lon, site_lat, site_lon)
+        self._latitude = nc_lat[self._site_j, self._site_i].astype(np.float32)
+        self._longitude = nc_lon[self._site_j, self._site_i].astype(np.float32)
+
+        self._temperature = pack_temperature(
+            read_site_series(nc_variables["temp"], self._site_j, self._site_i),
+            self._storage,
+        )
+        self._grid_shape = (len(self._site_j),)
+        nc_variables = None
+
+    @profiled("read_nc_window")
+    def read_nc_window(self, var_name, window):
+        """Read a window of a netcdf variable as float32
+
+        If a cache directory is configured, the decoded window is saved
+        there and later reads memory-map it instead of decompressing the
+        netcdf variable again.
+        """
+        if self._cache_directory is not None:
+            key = cache.cache_key(self._cru_temperature_nc_filename, var_name, window)
+            values = cache.load_cached_array(self._cache_directory, key)
+            if values is not None:
+                return values
+
+        nc_variable = self._cru_temperature_ncfile.variables[var_name]
+        if nc_variable.ndim == 3:
+            # Records are read in whole chunks and subsampled in memory
+            months = range(*window[0].indices(nc_variable.shape[0]))
+            plan = ReadPlan(nc_variable, window[1:])
+            values = plan.read(months.start, months.stop)[:: months.step]
+            plan.close()
+            self._record_plan_profile(plan)
+        else:
+            values = np.asarray(nc_variable[window]).astype(np.float32)
+            self._profiler.add_bytes_read("read_nc_window", values.nbytes)
+        self._profiler.count_allocation("read_nc_window", values)
+        nc_variable = None
+
+        if self._cache_directory is not None:
+            cache.save_cached_array(self._cache_directory, key, values)
+        return values
+
+    def get_profile(self):
+        """Time, bytes read and arrays allocated by each phase of the run
+
+        Profiling is enabled with "profile | yes" in the config file, or by
+        setting _profiler.enabled before initializing.  The netcdf_read and
+        astype_copy phases split the reads of the temperature record into
+        decompression and copying out the model window as float32.
+
+        Returns
+        -------
+        dict
+            Statistics (calls, seconds, bytes_read, arrays_allocated,
+            bytes_allocated) keyed by phase name.  Empty unless profiling
+            is enabled.
+        """
+        if not self._profiler.enabled:
+            return {}
+        profile = self._profiler.report()
+        if isinstance(self._temperature, StreamingTemperatureReader):
+            plan_profile = Profiler(enabled=True)
+            self._record_plan_profile(self._temperature.plan, plan_profile)
+            for name, stats in plan_profile.report().items():
+                profile["streaming_" + name] = stats
+        return profile
+
+    def _record_plan_profile(self, plan, profiler=None):
+        profiler = self._profiler if profiler is None else profiler
+        profiler.record("netcdf_read", plan.read_seconds, calls=plan.n_reads)
+        profiler.add_bytes_read("netcdf_read", plan.bytes_read)
+        profiler.record("astype_copy", plan.copy_seconds, calls=plan.n_reads)
+
+    def finalize(self):
+        """Release the temperature data and close the netcdf and output files"""
+        if self._output_writer is not None:
+            self._output_writer.close()
+            self._output_writer = None
+        if isinstance(self._temperature, StreamingTemperatureReader):
+            self._temperature.close()
+        if self._store_key is not None:
+            shared_store.release(self._store_key)
+            self._store_key = None
+        self._temperature = None
+
+        if self._cru_temperature_ncfile is not None:
+            self._cru_temperature_ncfile.close()
+            self._cru_temperature_ncfile = None
 
     def timestep_from_date(self, this_date):
         """Return the timestep from a date
         Note: assumes that the model's time values have been initialized
         Note: this may be inaccurate if partial timesteps (year) are used
         """
-        this_timestep = this_date.year - self._date_at_timestep0.year
-        return this_timestep
+        if self._time_units == "days":
+            return (this_date - self._date_at_timestep0).days
+        return self.timestep_from_time_index(
+            self.get_time_index(this_date.month, this_date.year)
+        )
+
+    def timestep_from_time_index(self, time_index):
+        """Return the timestep of a time coordinate of the netcdf file"""
+        if self._time_units == "months":
+            return time_index - self._time_index_at_timestep0
+        return time_index // 12 - self._time_index_at_timestep0 // 12
+
+    @property
+    def _current_date(self):
+        """The current model date, derived from the current time index"""
+        if self._time_index is None:
+            return None
+        if self._time_units == "days":
+            return self._date_at_timestep0 + dt.timedelta(days=self._day_index)
+        return self.date_from_time_index(self._time_index)
+
+    @_current_date.setter
+    def _current_date(self, this_date):
+        if self._time_units == "days":
+            self._day_index = (this_date - self._date_at_timestep0).days
+            self._time_index = self._day_time_index[self._day_index]
+        else:
+            self._time_index = self.get_time_index(this_date.month, this_date.year)
 
+    @property
+    def _current_timestep(self):
+        if self._time_units == "days":
+            return self._day_index
+        return self.timestep_from_time_index(self._time_index)
+
+    @profiled("increment_date")
     def increment_date(self, change_amount=None):
-        """Change the current date by a timedelta amount
+        """Change the current date by a number of timesteps
         and update the timestep to reflect that change
         """
         if change_amount is None:
             change_amount = self._timestep_duration
 
-        self._current_date += relativedelta(years=change_amount)
-        self._current_timestep = self.timestep_from_date(self._current_date)
+        if self._time_units == "days":
+            if change_amount != int(change_amount):
+                raise ValueError(
+                    f"can only change the date by whole days ({change_amount})"
+                )
+            self._day_index += int(change_amount)
+            self._time_index = self._day_time_index[self._day_index]
+            return
+
+        months = change_amount * self._months_per_step
+        if months != int(months):
+            raise ValueError(f"can only change the date by whole months ({months})")
+        self._time_index += int(months)
 
     def get_current_timestep(self):
-        return self.timestep_from_date(self._current_date)
+        return self._current_timestep
 
     def get_end_timestep(self):
         return self.timestep_from_date(self.last_date)
 
+    @profiled("update")
     def update(self, frac=None):
         # Update can handle fractional timesteps...sort of
         if frac is not None:
             print("Fractional times not yet permitted, rounding to nearest int")
-            time_change = self._timestep_duration * int(frac + 0.5)
+            n_steps = int(frac + 0.5)
         else:
-            time_change = self._timestep_duration
+            n_steps = 1
 
-        for n in range(time_change):
+        for n in range(n_steps):
             # Update values for one timestep
             self.increment_date()
 
         self.update_temperature_values()
+        if self._output_writer is not None and n_steps > 0:
+            # Fractions that round to no steps leave the timestep written
+            self._output_writer.append(self._current_timestep, self._output_grids)
 
     def get_time_index(self, month, year):
         """ Return the index of the time coordinate of the netcdf file
             for a specified month and year """
         return month + 12 * (year - self._first_valid_date.year) - 1
 
+    def date_from_time_index(self, time_index):
+        """ Return the model date of a time coordinate of the netcdf file """
+        return dt.date(
+            self._first_valid_date.year + time_index // 12,
+            time_index % 12 + 1,
+            self.day,
+        )
+
     def get_temperatures_month_year(self, month, year):
         """ Return the temperature field at specified month, year """
         # Check for valid month, year
@@ -495,10 +909,82 @@ class AlaskaTemperature:
         idx = self.get_time_index(month, year)
         assert idx >= 0
         if (testdate < self._first_valid_date) or (testdate > self._last_valid_date):
-            return np.zeros_like(self._temperature[idx, :, :]).fill(np.nan)
+            return np.zeros_like(self._temperature[idx]).fill(np.nan)
+
+        return self._temperature[idx]
 
-        return self._temperature[idx, :, :]
+    def precompute_temperature_series(self):
+        """Compute the output grids for every remaining timestep at once
+
+           Because each timestep is a whole number of years, the 12-month
+           windows of all timesteps start at the same calendar month.  The
+           record is viewed as (year, month, y, x) starting at that month, so
+           the current, January, and July grids of each timestep are strided
+           views and the annual means are a single reduction over the month
+           axis.
+        """
+        if self._timestep_duration < 1:
+            raise ValueError(
+                f"timestep must be at least 1 year ({self._timestep_duration})"
+            )
+        time_index = np.arange(
+            self._time_index,
+            self.get_time_index(self.last_date.month, self.last_date.year) + 1,
+            12 * self._timestep_duration,
+        )
+        window_start = time_index - 11
+        if window_start[0] < 0 or time_index[-1] >= self._temperature.shape[0]:
+            raise ValueError("model dates must be within the temperature record")
+
+        offset = window_start[0] % 12
+        n_years = (self._temperature.shape[0] - offset) // 12
+        by_year = self._temperature[offset : offset + 12 * n_years].reshape(
+            (n_years, 12) + self._temperature.shape[1:]
+        )
+        first_row = (window_start[0] - offset) // 12
+        stride = self._timestep_duration
+        windows = by_year[first_row : first_row + len(time_index) * stride : stride]
+
+        self._series_time_index = time_index
+        self._series = {
+            "T_air": windows[:, 11],
+            "T_air_prior_jan": windows[:, (0 - offset) % 12],
+            "T_air_prior_jul": windows[:, (6 - offset) % 12],
+            "T_air_prior_year": windows.mean(axis=1, dtype=np.float64).astype(
+                np.float32
+            ),
+        }
+        if not self._climate_outputs:
+            return
+
+        # Days in each month of each window, to weight degree days
+        months = (
+            np.datetime64(self._first_valid_date, "M")
+            + window_start[:, np.newaxis]
+            + np.arange(12)
+        )
+        days = (
+            (months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")
+        ).astype(np.float32)
+        days = days.reshape(days.shape + (1,) * (windows.ndim - 2))
+        climatology = self._climatology[time_index[0] % 12]
+
+        self._series.update(
+            {
+                "T_air_climatology": np.broadcast_to(
+                    climatology, windows[:, 11].shape
+                ),
+                "T_air_anomaly": windows[:, 11] - climatology,
+                "FDD_prior_year": (np.maximum(-windows, 0) * days)
+                .sum(axis=1, dtype=np.float64)
+                .astype(np.float32),
+                "TDD_prior_year": (np.maximum(windows, 0) * days)
+                .sum(axis=1, dtype=np.float64)
+                .astype(np.float32),
+            }
+        )
 
+    @profiled("update_temperature_values")
     def update_temperature_values(self):
         """Update the temperature array values based on the current date
 
@@ -506,128 +992,347 @@ class AlaskaTemperature:
            but also the previous monthly means for the this and the preceding
            11 months, and the annual average for the last 12 months
         """
-        year = self._current_date.year
-        month = self._current_date.month
-        self.T_air = self.get_temperatures_month_year(month, year)
-        self.T_air_prior_months = []
-
-        for monthnum in np.arange(-11, 1):
-            thisdate = self._current_date + relativedelta(months=monthnum)
-            self.T_air_prior_months.append(
-                self.get_temperatures_month_year(thisdate.month, thisdate.year)
+        idx = self._time_index
+
+        if self._series is not None:
+            step = np.searchsorted(self._series_time_index, idx)
+            if (
+                step < len(self._series_time_index)
+                and self._series_time_index[step] == idx
+            ):
+                for name in self._output_grid_names:
+                    np.copyto(getattr(self, name), self._series[name][step])
+                return
+
+        if self._month_ring is None:
+            # Slot k of the ring always holds calendar month k + 1
+            self._month_ring = np.empty(
+                (12,) + tuple(self._temperature.shape[1:]), dtype=np.float32
             )
-        self.T_air_prior_jan = self.T_air_prior_months[0]
-        self.T_air_prior_jul = self.T_air_prior_months[6]
-        self.T_air_prior_year = np.average(self.T_air_prior_months, axis=0)
+            self._ring_time_index = np.full(12, -1, dtype=np.int64)
+            self._ring_finite = np.zeros(12, dtype=bool)
+            self._ring_days = np.zeros(12, dtype=np.float32)
+            self._prior_year_sum = np.zeros(self._month_ring.shape[1:])
+            arrays = [self._month_ring, self._prior_year_sum]
+            if self._climate_outputs:
+                self._prior_year_fdd = np.zeros(self._month_ring.shape[1:])
+                self._prior_year_tdd = np.zeros(self._month_ring.shape[1:])
+                self._degree_days = np.empty(self._month_ring.shape[1:], np.float32)
+                arrays += [
+                    self._prior_year_fdd,
+                    self._prior_year_tdd,
+                    self._degree_days,
+                ]
+            for array in arrays:
+                self._profiler.count_allocation("update_temperature_values", array)
+
+        # Only months that are not already in the ring need to be read
+        new_months = [
+            n
+            for n in range(idx - 11, idx + 1)
+            if self._ring_time_index[n % 12] != n
+        ]
+        slots = [n % 12 for n in new_months]
+        # Cheaper to adjust the running sums than to recompute them, unless
+        # a month with NaN (e.g. before the record) enters or leaves them,
+        # since a NaN can't be subtracted out again
+        incremental = 2 * len(new_months) < 12 and self._ring_finite[slots].all()
+        if incremental:
+            for n in new_months:
+                slot = n % 12
+                self._prior_year_sum -= self._month_ring[slot]
+                if self._climate_outputs:
+                    self._add_degree_days(slot, -1)
+                self._load_month_into_ring(n)
+                self._prior_year_sum += self._month_ring[slot]
+                if self._climate_outputs:
+                    self._add_degree_days(slot, 1)
+            incremental = self._ring_finite[slots].all()
+        else:
+            for n in new_months:
+                self._load_month_into_ring(n)
+        if not incremental:
+            with self._profiler.phase("prior_year_recompute"):
+                self._month_ring.sum(
+                    axis=0, dtype=np.float64, out=self._prior_year_sum
+                )
+                if self._climate_outputs:
+                    self._prior_year_fdd.fill(0)
+                    self._prior_year_tdd.fill(0)
+                    for slot in range(12):
+                        self._add_degree_days(slot, 1)
+
+        with self._profiler.phase("prior_year_average"):
+            np.copyto(self.T_air_prior_jan, self._month_ring[0])
+            np.copyto(self.T_air_prior_jul, self._month_ring[6])
+            np.divide(self._prior_year_sum, 12, out=self.T_air_prior_year)
+            if self._climate_outputs:
+                np.copyto(self.FDD_prior_year, self._prior_year_fdd)
+                np.copyto(self.TDD_prior_year, self._prior_year_tdd)
+
+        if self._time_units == "days":
+            self.interpolate_daily_temperature()
+        else:
+            np.copyto(self.T_air, self._month_ring[idx % 12])
+        if self._climate_outputs:
+            np.copyto(self.T_air_climatology, self._climatology[idx % 12])
+            np.subtract(self.T_air, self.T_air_climatology, out=self.T_air_anomaly)
+
+    def compute_climatology(self):
+        """Compute the mean temperature grid of each calendar month
+
+           The climatology years of the record are read once, a month at a
+           time, and each month is added to the sum of its calendar month,
+           so the twelve means cost a single pass over the cube.
+        """
+        first_year, last_year = self._climatology_years
+        start = max(self.get_time_index(1, first_year), 0)
+        stop = min(self.get_time_index(12, last_year) + 1, self._temperature.shape[0])
+
+        grid_shape = tuple(self._temperature.shape[1:])
+        sums = np.zeros((12,) + grid_shape)
+        counts = np.zeros((12,) + (1,) * len(grid_shape))
+        month = np.empty(grid_shape, dtype=np.float32)
+        for n in range(start, stop):
+            if isinstance(self._temperature, PackedTemperature):
+                sums[n % 12] += self._temperature.decode(n, out=month)
+            else:
+                sums[n % 12] += self._temperature[n]
+            counts[n % 12] += 1
+        with np.errstate(invalid="ignore"):
+            # Calendar months without data are NaN
+            self._climatology = (sums / counts).astype(np.float32)
+
+    def _days_in_month(self, time_index):
+        """Number of days in the month of a netcdf time index"""
+        year = self._first_valid_date.year + time_index // 12
+        return calendar.monthrange(year, time_index % 12 + 1)[1]
+
+    def _add_degree_days(self, slot, sign):
+        """Add (or with sign -1 remove) the degree days of a ring month"""
+        days = sign * self._ring_days[slot]
+        np.maximum(self._month_ring[slot], 0, out=self._degree_days)
+        self._degree_days *= days
+        self._prior_year_tdd += self._degree_days
+        np.minimum(self._month_ring[slot], 0, out=self._degree_days)
+        self._degree_days *= -days
+        self._prior_year_fdd += self._degree_days
+
+    def build_daily_interpolation(self):
+        """Tabulate how each day interpolates between monthly means
+
+           Monthly means are taken as the temperatures at the middle of each
+           month.  For every day from the timestep 0 date to the end of the
+           record, this finds the netcdf time index of the day's month, of
+           the monthly mean before the middle of the day, and the weight of
+           the monthly mean after it, so that stepping through days needs
+           no date arithmetic.
+        """
+        days = np.arange(
+            np.datetime64(self._date_at_timestep0, "D"),
+            np.datetime64(self._last_valid_date, "D") + 1,
+        )
+        months = days.astype("datetime64[M]")
+        month_start = months.astype("datetime64[D]")
+        month_end = (months + 1).astype("datetime64[D]")
+        month_length = (month_end - month_start).astype(np.float64)
+        prior_length = (month_start - (months - 1).astype("datetime64[D]")).astype(
+            np.float64
+        )
+        next_length = ((months + 2).astype("datetime64[D]") - month_end).astype(
+            np.float64
+        )
+
+        # Middle of each day relative to the middle of its month
+        offset = (days - month_start).astype(np.float64) + 0.5 - month_length / 2
+        after_middle = offset >= 0
+
+        self._day_time_index = (
+            months - np.datetime64(self._first_valid_date, "M")
+        ).astype(np.int64)
+        self._day_lower_index = np.where(
+            after_middle, self._day_time_index, self._day_time_index - 1
+        )
+        self._day_weight = np.where(
+            after_middle,
+            offset / ((month_length + next_length) / 2),
+            1 + offset / ((prior_length + month_length) / 2),
+        ).astype(np.float32)
+
+    def interpolate_daily_temperature(self):
+        """Set T_air to the temperature interpolated to the current day
+
+           The grids of the two monthly means around the day are only read
+           when the day passes the middle of a month, so each day costs a
+           multiply and an add over the grid.  With "mean_preserving"
+           interpolation the monthly means are first adjusted so that the
+           interpolated temperatures average (approximately) to the means.
+        """
+        lower = self._day_lower_index[self._day_index]
+        if lower != self._knot_time_index:
+            if self._interpolation == "mean_preserving":
+                base = self._adjusted_monthly_mean(lower)
+                slope = self._adjusted_monthly_mean(lower + 1)
+            else:
+                base = self._monthly_mean(lower)
+                slope = self._monthly_mean(lower + 1)
+            slope -= base
+            self._knot_base = base
+            self._knot_slope = slope
+            self._knot_time_index = lower
+
+        np.multiply(self._knot_slope, self._day_weight[self._day_index], out=self.T_air)
+        self.T_air += self._knot_base
+
+    def _monthly_mean(self, time_index):
+        """Copy of the monthly means at a time index, clipped to the record"""
+        time_index = min(max(time_index, 0), self._temperature.shape[0] - 1)
+        return np.array(self._temperature[time_index], dtype=np.float32)
+
+    def _adjusted_monthly_mean(self, time_index):
+        """Monthly means adjusted so that linear interpolation keeps them
+
+           Interpolating linearly between mid-month values a gives a
+           monthly average of about (a[m-1] + 6 a[m] + a[m+1]) / 8, so
+           using a[m] = (10 T[m] - T[m-1] - T[m+1]) / 8 keeps the average
+           to second order.
+        """
+        adjusted = self._monthly_mean(time_index)
+        adjusted *= 10
+        adjusted -= self._monthly_mean(time_index - 1)
+        adjusted -= self._monthly_mean(time_index + 1)
+        adjusted /= 8
+        return adjusted
+
+    @profiled("load_month")
+    def _load_month_into_ring(self, time_index):
+        """Copy the temperatures at a netcdf time index into the ring buffer"""
+        slot = time_index % 12
+        if 0 <= time_index < self._temperature.shape[0]:
+            if isinstance(self._temperature, PackedTemperature):
+                # Decode straight into the ring
+                self._temperature.decode(time_index, out=self._month_ring[slot])
+            else:
+                self._month_ring[slot] = self._temperature[time_index]
+        else:
+            self._month_ring[slot] = np.nan
+        self._ring_finite[slot] = np.isfinite(self._month_ring[slot]).all()
+        self._ring_time_index[slot] = time_index
+        if self._climate_outputs:
+            self._ring_days[slot] = self._days_in_month(time_index)
+
+    @property
+    def T_air_prior_months(self):
+        """Temperature grids of the prior 12 months, oldest first"""
+        if self._month_ring is None:
+            if self._series is None:
+                return None
+            # Precomputed runs don't fill the ring, so view the record
+            idx = self._time_index
+            return self._temperature[idx - 11 : idx + 1]
+        return self._month_ring[np.argsort(self._ring_time_index)]
 
     def read_config_file(self):
-        # Open CFG file to read data
-        cfg_unit = open(self.cfg_file, "r")
+        """Set an attribute for each option of the old-style file cfg_file
+
+        Values are converted to numpy scalars of their declared type.
+        """
+        numpy_types = {
+            "float64": np.float64,
+            "np.float64": np.float64,
+            "float32": np.float32,
+            "np.float32": np.float32,
+            "long": np.int64,
+            "long int": np.int64,
+            "np.int64": np.int64,
+            "int": np.int32,
+            "np.int32": np.int32,
+            "short": np.int16,
+            "short int": np.int16,
+            "int16": np.int16,
+            "np.int16": np.int16,
+        }
         last_var_name = ""
 
-        while True:
-            line = cfg_unit.readline()
-            if line == "":
-                break  # (reached end of file)
-
-            # Comments are lines that start with '#'
-            COMMENT = line[0] == "#"
-
-            # Columns are delimited by '|'
-            words = line.split("|")
-
-            # Only process non-comment lines with exactly 4 words
-            # Note: the 4th word describes the variable, and is ignored
-            if (len(words) == 4) and not COMMENT:
-                var_name = words[0].strip()
-                value = words[1].strip()
-                var_type = words[2].strip()
-
-                READ_SCALAR = False
-                READ_FILENAME = False
-
-                # Does var_name end with an array subscript ?
-                p1 = var_name.rfind("[")
-                p2 = var_name.rfind("]")
-                if (p1 > 0) and (p2 > p1):
-                    var_base = var_name[:p1]
-                    subscript = var_name[p1 : p2 + 1]
-                    var_name_file_str = var_base + "_file" + subscript
+        for var_name, value, var_type, _ in read_oldstyle_options(self.cfg_file):
+            READ_SCALAR = False
+            READ_FILENAME = False
+
+            # Does var_name end with an array subscript ?
+            p1 = var_name.rfind("[")
+            p2 = var_name.rfind("]")
+            if (p1 > 0) and (p2 > p1):
+                var_base = var_name[:p1]
+                subscript = var_name[p1 : p2 + 1]
+                var_name_file_str = var_base + "_file" + subscript
+            else:
+                var_base = var_name
+                var_name_file_str = var_name + "_file"
+
+            # if the immediately preceding line describes this variables's
+            # type, change the type of this variable
+            if last_var_name.startswith(var_base + "_type"):
+                type_choice = self._get_config_attribute(last_var_name)
+                if type_choice.lower() == "scalar":
+                    self._set_config_attribute(var_name_file_str, "")
+                    READ_SCALAR = True
                 else:
-                    var_base = var_name
-                    var_name_file_str = var_name + "_file"
-
-                # if the immediately preceding line describes this variables's
-                # type, change the type of this variable
-                if last_var_name.startswith(var_base + "_type"):
-                    type_choice = "undefined"
-                    exec("type_choice = self." + last_var_name)
-                    if type_choice.lower() == "scalar":
-                        exec("self." + var_name_file_str + " = ''")
-                        READ_SCALAR = True
-                    else:
-                        exec("self." + var_name + " = 0.0")
-                        READ_FILENAME = True
-
-                # -----------------------------------
-                # Read a value of type "var_type"
-                # -----------------------------------
+                    self._set_config_attribute(var_name, 0.0)
+                    READ_FILENAME = True
+
+            if var_type in numpy_types:
                 # Convert scalars to numpy scalars
-                # -----------------------------------
-                if var_type in ["float64", "np.float64"]:
-                    value = np.float64(value)
-                    exec("self." + var_name + " = value")
-                elif var_type in ["float32", "np.float32"]:
-                    value = np.float32(value)
-                    exec("self." + var_name + " = value")
-                elif var_type in ["long", "long int", "np.int64"]:
-                    value = np.int64(value)
-                    exec("self." + var_name + " = value")
-                elif var_type in ["int", "np.int32"]:
-                    value = np.int32(value)
-                    exec("self." + var_name + " = value")
-                elif var_type in ["short", "short int", "int16", "np.int16"]:
-                    value = np.int16(value)
-                    exec("self." + var_name + " = value")
-                elif var_type == "string":
-                    # Replace [case_prefix] or [site_prefix] in a string's value
-                    # with the appropriate values
-                    case_str = "[case_prefix]"
-                    site_str = "[site_prefix]"
-                    s = value
-                    if s[:13] == case_str:
-                        value_str = self.case_prefix + s[13:]
-                    elif s[:13] == site_str:
-                        value_str = self.site_prefix + s[13:]
-                    else:
-                        value_str = s
-
-                    assert value_str is not None
-
-                    # If var_name starts with "SAVE_" and value is
-                    # Yes or No, then convert to Python boolean.
-                    if var_name[:5] == "SAVE_":
-                        VALUE_SET = True
-                        if s.lower() in ["yes", "true"]:
-                            exec("self." + var_name + " = True")
-                        elif s.lower() in ["no", "false"]:
-                            exec("self." + var_name + " = False")
-                        else:
-                            VALUE_SET = False
-                    else:
-                        VALUE_SET = False
-
-                    # If string wasn't a SAVE_ variable, set it here
-                    if not VALUE_SET:
-                        if READ_FILENAME:
-                            exec("self." + var_name_file_str + " = value_str")
-                        elif READ_SCALAR:
-                            exec("self." + var_name + " = np.float64(value_str)")
-                        else:
-                            exec("self." + var_name + " = value_str")
+                self._set_config_attribute(var_name, numpy_types[var_type](value))
+            elif var_type == "string":
+                # Replace [case_prefix] or [site_prefix] in a string's value
+                # with the appropriate values
+                if value.startswith("[case_prefix]"):
+                    value_str = self.case_prefix + value[13:]
+                elif value.startswith("[site_prefix]"):
+                    value_str = self.site_prefix + value[13:]
+                else:
+                    value_str = value
+
+                if var_name[:5] == "SAVE_" and value.lower() in [
+                    "yes",
+                    "true",
+                    "no",
+                    "false",
+                ]:
+                    # Yes or No SAVE_ variables are Python booleans
+                    self._set_config_attribute(var_name, is_yes(value))
+                elif READ_FILENAME:
+                    self._set_config_attribute(var_name_file_str, value_str)
+                elif READ_SCALAR:
+                    self._set_config_attribute(var_name, np.float64(value_str))
                 else:
-                    raise ValueError(
-                        "In read_config_file(), unsupported data type: %d" % var_type
-                    )
+                    self._set_config_attribute(var_name, value_str)
+            else:
+                raise ValueError(
+                    "In read_config_file(), unsupported data type: %s" % var_type
+                )
+
+            last_var_name = var_name
 
-                last_var_name = var_name
+    def _get_config_attribute(self, var_name):
+        """Value of an attribute named in a config file, e.g. x or x[2]"""
+        name, index = self._split_subscript(var_name)
+        if index is None:
+            return getattr(self, name)
+        return getattr(self, name)[index]
+
+    def _set_config_attribute(self, var_name, value):
+        """Set an attribute named in a config file, e.g. x or x[2]"""
+        name, index = self._split_subscript(var_name)
+        if index is None:
+            setattr(self, name, value)
+        else:
+            getattr(self, name)[index] = value
+
+    @staticmethod
+    def _split_subscript(var_name):
+        p1 = var_name.rfind("[")
+        p2 = var_name.rfind("]")
+        if (p1 > 0) and (p2 > p1):
+            return var_name[:p1], int(var_name[p1 + 1 : p2])
+        return var_name, None
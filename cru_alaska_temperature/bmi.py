@@ -9,28 +9,23 @@ For use with Permamodel components
 
 """
 import os
-import pathlib
-import pkg_resources
 
 import numpy as np
 
-from .alaska_temperature import AlaskaTemperature
+from .alaska_temperature import AlaskaTemperature, data_directory, examples_directory
+from .profiling import Profiler, profiled
 """
 class FrostnumberMethod( frost_number.BmiFrostnumberMethod ):
     _thisname = 'this name'
 """
 
-examples_directory = pathlib.Path(
-    pkg_resources.resource_filename("cru_alaska_temperature", "examples")
-)
+_disabled_profiler = Profiler()
 
 
 class AlaskaTemperatureBMI(object):
     """Provides BMI interface to CRU Alaska Temperature data"""
 
-    METADATA = pkg_resources.resource_filename(
-        "cru_alaska_temperature", "data/AlaskaTemperatureBMI"
-    )
+    METADATA = str(data_directory / "AlaskaTemperatureBMI")
 
     def __init__(self):
         self._model = None
@@ -38,6 +33,7 @@ class AlaskaTemperatureBMI(object):
         self._var_units = {}
         self._grids = {}
         self._grid_type = {}
+        self._output_rows = {}
 
         self._name = "AlaskaTemperature"
 
@@ -61,6 +57,10 @@ class AlaskaTemperatureBMI(object):
             "atmosphere_bottom_air__temperature_mean_jan",
             "atmosphere_bottom_air__temperature_mean_jul",
             "atmosphere_bottom_air__temperature_year",
+            "atmosphere_bottom_air__temperature_climatology",
+            "atmosphere_bottom_air__temperature_anomaly",
+            "atmosphere_bottom_air__freezing_degree_days",
+            "atmosphere_bottom_air__thawing_degree_days",
         )
 
         self._var_name_map = {
@@ -68,6 +68,10 @@ class AlaskaTemperatureBMI(object):
             "atmosphere_bottom_air__temperature_mean_jan": "T_air_prior_jan",
             "atmosphere_bottom_air__temperature_mean_jul": "T_air_prior_jul",
             "atmosphere_bottom_air__temperature_year": "T_air_prior_year",
+            "atmosphere_bottom_air__temperature_climatology": "T_air_climatology",
+            "atmosphere_bottom_air__temperature_anomaly": "T_air_anomaly",
+            "atmosphere_bottom_air__freezing_degree_days": "FDD_prior_year",
+            "atmosphere_bottom_air__thawing_degree_days": "TDD_prior_year",
         }
 
         self._var_units_map = {
@@ -75,6 +79,10 @@ class AlaskaTemperatureBMI(object):
             "atmosphere_bottom_air__temperature_mean_jan": "deg_C",
             "atmosphere_bottom_air__temperature_mean_jul": "deg_C",
             "atmosphere_bottom_air__temperature_year": "deg_C",
+            "atmosphere_bottom_air__temperature_climatology": "deg_C",
+            "atmosphere_bottom_air__temperature_anomaly": "deg_C",
+            "atmosphere_bottom_air__freezing_degree_days": "deg_C d",
+            "atmosphere_bottom_air__thawing_degree_days": "deg_C d",
             "datetime__start": "days",
             "datetime__end": "days",
         }
@@ -86,6 +94,14 @@ class AlaskaTemperatureBMI(object):
 
         self._name = "Permamodel CRU-AK Temperature Component"
 
+        # The climatology, anomaly and degree day outputs are only provided
+        # when the config file asks for them
+        self._output_var_names = tuple(
+            varname
+            for varname in self._var_name_map
+            if self._var_name_map[varname] in self._model._output_grid_names
+        )
+
         # Verify that all input and output variable names are mapped
         for varname in self._input_var_names:
             assert varname in self._var_name_map
@@ -100,20 +116,29 @@ class AlaskaTemperatureBMI(object):
             self._grids[gridnumber] = varname
             self._grid_type[gridnumber] = "uniform_rectilinear"
             gridnumber += 1
+        # A model run at a list of sites has one node per site
+        if self._model._site_file is None:
+            output_grid_type = "uniform_rectilinear"
+        else:
+            output_grid_type = "points"
         for varname in self._output_var_names:
             self._grids[gridnumber] = varname
-            self._grid_type[gridnumber] = "uniform_rectilinear"
+            self._grid_type[gridnumber] = output_grid_type
             gridnumber += 1
 
         self._values = {
             # These are the links to the model's variables and
             # should be consistent with _var_name_map
-            "atmosphere_bottom_air__temperature": self._model.T_air,
-            "atmosphere_bottom_air__temperature_mean_jan": self._model.T_air_prior_jan,
-            "atmosphere_bottom_air__temperature_mean_jul": self._model.T_air_prior_jul,
-            "atmosphere_bottom_air__temperature_year": self._model.T_air_prior_year,
-            "datetime__start": self._model.first_date,
-            "datetime__end": self._model.last_date,
+            varname: getattr(self._model, self._var_name_map[varname])
+            for varname in self._output_var_names
+        }
+        self._values["datetime__start"] = self._model.first_date
+        self._values["datetime__end"] = self._model.last_date
+
+        # Row of each output variable within the model's stacked output grids
+        self._output_rows = {
+            varname: self._model._output_grid_names.index(self._var_name_map[varname])
+            for varname in self._output_var_names
         }
 
     def get_attribute(self, att_name):
@@ -156,42 +181,17 @@ class AlaskaTemperatureBMI(object):
 
     def update(self):
         # Update the time
+        # The model updates its output grids in place, so the arrays
+        # in self._values (and any references to them) stay current
         self._model.update()
 
-        # Set the bmi temperature to the updated value in the model
-        self._values["atmosphere_bottom_air__temperature"] = self._model.T_air
-        self._values[
-            "atmosphere_bottom_air__temperature_mean_jan"
-        ] = self._model.T_air_prior_jan
-        self._values[
-            "atmosphere_bottom_air__temperature_mean_jul"
-        ] = self._model.T_air_prior_jul
-        self._values[
-            "atmosphere_bottom_air__temperature_year"
-        ] = self._model.T_air_prior_year
-
     def update_frac(self, time_fraction):
         """
-        Model date is a floating point number of days.  This
-        can be updated by fractional day, but update() will
-        only be called if the integer value of the day changes
+        Advance the model by a fraction of a timestep.  The model
+        only takes whole timesteps, so the fraction is rounded to the
+        nearest number of timesteps
         """
-        self._model.increment_date(
-            change_amount=time_fraction * self._model._timestep_duration
-        )
-        self._model.update_temperature_values()
-
         self._model.update(frac=time_fraction)
-        self._values["atmosphere_bottom_air__temperature"] = self._model.T_air
-        self._values[
-            "atmosphere_bottom_air__temperature_mean_jan"
-        ] = self._model.T_air_prior_jan
-        self._values[
-            "atmosphere_bottom_air__temperature_mean_jul"
-        ] = self._model.T_air_prior_jul
-        self._values[
-            "atmosphere_bottom_air__temperature_year"
-        ] = self._model.T_air_prior_year
 
     def update_until(self, time):
         """Advance model state until the given time.
@@ -202,29 +202,42 @@ class AlaskaTemperatureBMI(object):
           A model time value.
 
         """
-        stop_year = time + self._model._date_at_timestep0.year
-
-        if stop_year < self._model._current_date.year:
+        if time < self.get_current_time():
             print(
-                "Warning: update_until date--%d--is less than current\
-                  date--%d"
-                % (stop_year, self._model._current_date.year)
+                "Warning: update_until time--%g--is less than current\
+                  time--%g"
+                % (time, self.get_current_time())
             )
             print("  no update run")
             return
 
-        if stop_year > self._model.last_date.year:
-            print("Warning: update_until date--%d" % stop_year)
-            print("  was greater than end_date--%d." % self._model.last_date.year)
-            print("  Setting stop_year to last_date")
-            stop_year = self._model.last_date.year
+        if time > self.get_end_time():
+            print("Warning: update_until time--%g" % time)
+            print("  was greater than end time--%g." % self.get_end_time())
+            print("  Setting stop time to end time")
+            time = self.get_end_time()
 
-        # Run update() one timestep at a time until stop_year
-        while self._model._current_date.year < stop_year:
+        # Run update() one timestep at a time until time
+        while self.get_current_time() < time:
             self.update()
 
     def finalize(self):
-        pass
+        self._model.finalize()
+
+    @property
+    def _profiler(self):
+        # The BMI getters are timed by the model's profiler
+        if self._model is None:
+            return _disabled_profiler
+        return self._model._profiler
+
+    def get_profile(self):
+        """Time, bytes read and arrays allocated by each phase of the run
+
+        See AlaskaTemperature.get_profile.  BMI getters are timed as
+        phases named after them.
+        """
+        return self._model.get_profile()
 
     def get_grid_type(self, grid_number):
         return self._grid_type[grid_number]
@@ -235,6 +248,7 @@ class AlaskaTemperatureBMI(object):
         # to get the number of days
         return float(self._model._timestep_duration)
 
+    @profiled("bmi.get_value_ref")
     def get_value_ref(self, var_name):
         return self._values[var_name]
 
@@ -246,7 +260,7 @@ class AlaskaTemperatureBMI(object):
         self.get_value_ref(var_name).flat[indices] = new_var_values
 
     def get_var_itemsize(self, var_name):
-        return np.asarray(self.get_value_ref(var_name)).flatten()[0].nbytes
+        return np.asarray(self.get_value_ref(var_name)).itemsize
 
     def get_value_at_indices(self, var_name, indices):
         return self.get_value_ref(var_name).take(indices)
@@ -254,8 +268,60 @@ class AlaskaTemperatureBMI(object):
     def get_var_nbytes(self, var_name):
         return np.asarray(self.get_value_ref(var_name)).nbytes
 
+    @profiled("bmi.get_value")
     def get_value(self, var_name, out):
-        out[:] = self.get_value_ref(var_name).flat
+        out[:] = self.get_value_ref(var_name).reshape(-1)
+        return out
+
+    @profiled("bmi.get_values")
+    def get_values(self, var_names, out=None):
+        """Copy several output variables into the rows of one array.
+
+        Parameters
+        ----------
+        var_names : sequence of str
+            Names of output variables.
+        out : ndarray, optional
+            A (len(var_names), n_nodes) array to fill.
+
+        Returns
+        -------
+        ndarray
+            The values of each variable, one variable per row.
+        """
+        rows = [self._output_rows[name] for name in var_names]
+        grids = self._model._output_grids.reshape((len(self._output_rows), -1))
+        if out is None:
+            out = np.empty((len(rows), grids.shape[1]), dtype=grids.dtype)
+        return np.take(grids, rows, axis=0, out=out)
+
+    @profiled("bmi.get_values_at_indices")
+    def get_values_at_indices(self, var_names, indices, out=None):
+        """Copy several output variables at a set of nodes into one array.
+
+        Parameters
+        ----------
+        var_names : sequence of str
+            Names of output variables.
+        indices : array_like of int
+            Flat indices of the nodes.
+        out : ndarray, optional
+            A (len(var_names), len(indices)) array to fill.
+
+        Returns
+        -------
+        ndarray
+            The values of each variable at the nodes, one variable per row.
+        """
+        rows = [self._output_rows[name] for name in var_names]
+        grids = self._model._output_grids.reshape((len(self._output_rows), -1))
+        indices = np.asarray(indices).reshape(-1)
+        if out is None:
+            out = np.empty((len(rows), len(indices)), dtype=grids.dtype)
+        # Take a row at a time, so nothing is allocated beyond out
+        for out_row, row in zip(out, rows):
+            np.take(grids[row], indices, out=out_row)
+        return out
 
     def get_var_type(self, var_name):
         return str(self.get_value_ref(var_name).dtype)
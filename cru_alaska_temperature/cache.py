@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+An on-disk cache of decoded netcdf variables
+
+The CRU NCEP netcdf files are compressed, so every read of the temperature
+record decompresses it again.  Decoded windows of a variable are saved here
+as uncompressed .npy files that later runs memory-map instead.
+"""
+import hashlib
+import os
+import pathlib
+import tempfile
+
+import numpy as np
+
+
+def cache_key(nc_filename, var_name, window):
+    """Key for a window of a netcdf variable
+
+    The key changes if the netcdf file is modified.
+
+    Parameters
+    ----------
+    nc_filename : str or Path, or list of them
+        Path to the netcdf file, or to each file of a record split across
+        files.
+    var_name : str
+        Name of the variable within the file.
+    window : tuple of slice
+        The slices of the variable that are read.
+
+    Returns
+    -------
+    str
+        A string that can be used as a file name.
+    """
+    if isinstance(nc_filename, (list, tuple)):
+        paths = [pathlib.Path(name).resolve() for name in nc_filename]
+    else:
+        paths = [pathlib.Path(nc_filename).resolve()]
+    files = []
+    for path in paths:
+        stat = path.stat()
+        files.append((str(path), stat.st_mtime_ns, stat.st_size))
+    description = repr(
+        (
+            files[0] if len(files) == 1 else tuple(files),
+            var_name,
+            tuple((w.start, w.stop, w.step) for w in window),
+        )
+    )
+    digest = hashlib.sha1(description.encode("utf-8")).hexdigest()
+    return f"{paths[0].stem}_{var_name}_{digest}"
+
+
+def load_cached_array(cache_directory, key):
+    """Memory-map a cached array, or return None if it isn't cached"""
+    try:
+        return np.load(pathlib.Path(cache_directory) / f"{key}.npy", mmap_mode="r")
+    except FileNotFoundError:
+        return None
+
+
+def save_cached_array(cache_directory, key, array):
+    """Save an array to the cache
+
+    The array is written to a temporary file that is then renamed, so that
+    other processes never see a partially written file.
+    """
+    cache_directory = pathlib.Path(cache_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(suffix=".npy", dir=cache_directory)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            np.save(fp, array)
+        os.replace(tmp_name, cache_directory / f"{key}.npy")
+    except BaseException:
+        os.remove(tmp_name)
+        raise
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Parse and validate config files
+
+Old-style config files hold one ``name | value | type | description`` line
+per option; YAML config files hold a mapping of the same options.  Either is
+parsed into a dict of typed values: integers, yes/no flags as bools, dates,
+the grid shape and the numpy dtype of each grid.  Parsed files are cached by
+path and modification time, so the members of an ensemble that share a
+config file only parse it once.
+"""
+import datetime as dt
+import pathlib
+import threading
+import time
+
+import numpy as np
+
+# Options that must hold integers, whatever type the config file declares
+INT_OPTIONS = (
+    "model_start_year",
+    "model_end_year",
+    "timestep",
+    "i_ul",
+    "j_ul",
+    "i_skip",
+    "j_skip",
+    "read_ahead_months",
+    "max_open_files",
+    "output_flush_steps",
+    "climatology_first_year",
+    "climatology_last_year",
+)
+
+# Options that hold yes or no
+FLAG_OPTIONS = (
+    "prefetch",
+    "precompute_outputs",
+    "climate_outputs",
+    "shared_temperature_store",
+    "profile",
+)
+
+# Options that every config file must set
+REQUIRED_OPTIONS = (
+    "timestep",
+    "grid_shape",
+    "grid_type",
+    "grids",
+    "i_ul",
+    "j_ul",
+)
+
+# Files modified less than this many seconds ago are not cached, since a
+# second write within the resolution of the file system clock would leave
+# their modification time unchanged
+RACY_SECONDS = 2.0
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def is_yes(value):
+    """Interpret a yes/no (or true/false) config value as a bool
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.config import is_yes
+    >>> is_yes("Yes"), is_yes("false"), is_yes(True)
+    (True, False, True)
+    >>> is_yes("maybe")
+    Traceback (most recent call last):
+    ...
+    ValueError: value must be yes or no (maybe)
+    """
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("yes", "true"):
+        return True
+    if str(value).lower() in ("no", "false"):
+        return False
+    raise ValueError(f"value must be yes or no ({value})")
+
+
+def grid_dtype(name):
+    """The numpy dtype of a grid type named in a config file
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.config import grid_dtype
+    >>> grid_dtype("np.float"), grid_dtype("float32")
+    (dtype('float64'), dtype('float32'))
+    """
+    name = str(name)
+    for prefix in ("np.", "numpy."):
+        if name.startswith(prefix):
+            name = name[len(prefix) :]
+    if name == "float":
+        # np.float was an alias of the builtin float
+        name = "float64"
+    try:
+        return np.dtype(name)
+    except TypeError:
+        raise ValueError(f"unknown grid type ({name})")
+
+
+def read_oldstyle_options(cfg_filename):
+    """The options of an old-style config file, as written
+
+    Returns
+    -------
+    tuple of tuple
+        The name, value, declared type and line number of each option, in
+        the order of the file.
+    """
+    return _cached(cfg_filename, "options", _parse_oldstyle_options)
+
+
+def load_config(cfg_filename, style="oldstyle"):
+    """Parse and validate a config file
+
+    Parameters
+    ----------
+    cfg_filename : str or Path
+        Path to the config file.
+    style : {'oldstyle', 'yaml'}, optional
+        Format of the config file.
+
+    Returns
+    -------
+    dict
+        The typed value of each option.  This is a copy that the caller may
+        modify.
+    """
+    if style not in ("oldstyle", "yaml"):
+        raise ValueError(f"config style must be oldstyle or yaml ({style})")
+    cfg_struct = _cached(cfg_filename, style, _PARSERS[style])
+    return dict(cfg_struct, grids=dict(cfg_struct["grids"]))
+
+
+def clear_cache():
+    """Forget every parsed config file"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _cached(cfg_filename, kind, parse):
+    path = pathlib.Path(cfg_filename).resolve()
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (str(path), kind)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    parsed = parse(path)
+    if time.time() - stat.st_mtime > RACY_SECONDS:
+        with _cache_lock:
+            _cache[key] = (stamp, parsed)
+    return parsed
+
+
+def _parse_oldstyle_options(path):
+    options = []
+    with open(path, "r") as cfg_file:
+        for lineno, line in enumerate(cfg_file, start=1):
+            # Comments start with '#'.  The 4th word describes the option
+            words = line.split("|")
+            if len(words) == 4 and not line.startswith("#"):
+                name, value, var_type = (word.strip() for word in words[:3])
+                options.append((name, value, var_type, lineno))
+    return tuple(options)
+
+
+def _parse_oldstyle_config(path):
+    cfg_struct = {}
+    grid_struct = {}
+    for name, value, var_type, lineno in read_oldstyle_options(path):
+        where = f"{path}, line {lineno}"
+        if name.startswith("grid"):
+            # grid variables are processed after the whole file is read
+            grid_struct[name] = value
+        elif name.endswith("date"):
+            cfg_struct[name] = _convert(_parse_date, name, value, where)
+        elif var_type in ("int", "long"):
+            cfg_struct[name] = _convert(int, name, value, where)
+        elif var_type in ("float", "float32", "float64"):
+            cfg_struct[name] = _convert(float, name, value, where)
+        else:
+            cfg_struct[name] = value
+
+    for name in ("grid_columns", "grid_rows", "grid_type", "grid_name"):
+        if name not in grid_struct:
+            raise ValueError(f"{path}: missing config option {name}")
+    columns = _convert(int, "grid_columns", grid_struct["grid_columns"], path)
+    rows = _convert(int, "grid_rows", grid_struct["grid_rows"], path)
+    cfg_struct["grid_shape"] = (columns, rows)
+    cfg_struct["grid_type"] = grid_struct["grid_type"]
+    cfg_struct["grids"] = {grid_struct["grid_name"]: "np.float"}
+
+    return _validate(cfg_struct, path)
+
+
+def _parse_yaml_config(path):
+    import yaml
+
+    class Loader(yaml.SafeLoader):
+        pass
+
+    # Grid shapes have been written as python tuples
+    Loader.add_constructor(
+        "tag:yaml.org,2002:python/tuple",
+        lambda loader, node: tuple(loader.construct_sequence(node)),
+    )
+    with open(path, "r") as cfg_file:
+        cfg_struct = yaml.load(cfg_file, Loader=Loader)
+    if not isinstance(cfg_struct, dict):
+        raise ValueError(f"{path}: config file must hold a mapping")
+
+    for name, value in cfg_struct.items():
+        if name.endswith("date"):
+            cfg_struct[name] = _convert(_parse_date, name, value, path)
+    if "grid_shape" in cfg_struct:
+        cfg_struct["grid_shape"] = _convert(
+            lambda shape: tuple(int(n) for n in shape),
+            "grid_shape",
+            cfg_struct["grid_shape"],
+            path,
+        )
+    return _validate(cfg_struct, path)
+
+
+_PARSERS = {"oldstyle": _parse_oldstyle_config, "yaml": _parse_yaml_config}
+
+
+def _validate(cfg_struct, where):
+    for name in REQUIRED_OPTIONS:
+        if name not in cfg_struct:
+            raise ValueError(f"{where}: missing config option {name}")
+    for name in INT_OPTIONS:
+        if name in cfg_struct:
+            cfg_struct[name] = _convert(int, name, cfg_struct[name], where)
+    for name in FLAG_OPTIONS:
+        if name in cfg_struct:
+            cfg_struct[name] = _convert(is_yes, name, cfg_struct[name], where)
+
+    if len(cfg_struct["grid_shape"]) != 2 or min(cfg_struct["grid_shape"]) < 1:
+        raise ValueError(f"{where}: bad shape for grid ({cfg_struct['grid_shape']})")
+    if not isinstance(cfg_struct["grids"], dict) or not cfg_struct["grids"]:
+        raise ValueError(f"{where}: at least one grid is required")
+    cfg_struct["grids"] = {
+        str(name): _convert(grid_dtype, name, dtype, where)
+        for name, dtype in cfg_struct["grids"].items()
+    }
+    return cfg_struct
+
+
+def _convert(convert, name, value, where):
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: bad value for {name} ({value})")
+
+
+def _parse_date(value):
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    return dt.datetime.strptime(value, "%Y-%m-%d").date()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Run many AlaskaTemperatureBMI instances in parallel
+
+An ensemble is a list of old-style config files, for example the tiles of
+a larger domain written by write_tiled_config_files().  Each member runs
+initialize/update_until/finalize in its own process and the outputs can be
+put back together with mosaic().
+"""
+import concurrent.futures
+import pathlib
+
+import numpy as np
+
+from .alaska_temperature import AlaskaTemperature
+from .bmi import AlaskaTemperatureBMI
+
+
+def set_oldstyle_config_values(cfg_text, values):
+    """Replace values in the text of an old-style config file
+
+    Parameters
+    ----------
+    cfg_text : str
+        Contents of a config file with lines of "name | value | type | doc".
+    values : dict
+        New values keyed by variable name.  Variables not already in the
+        file are appended as ints or strings.
+
+    Returns
+    -------
+    str
+        The new contents of the config file.
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.ensemble import set_oldstyle_config_values
+    >>> text = "i_ul | 50 | int | i-coord\\n"
+    >>> print(set_oldstyle_config_values(text, {"i_ul": 60, "j_ul": 5}), end="")
+    i_ul | 60 | int | i-coord
+    j_ul | 5 | int | set for ensemble member
+    """
+    remaining = dict(values)
+    lines = []
+    for line in cfg_text.splitlines(keepends=True):
+        words = line.split("|")
+        if len(words) == 4 and line[0] != "#" and words[0].strip() in remaining:
+            value = remaining.pop(words[0].strip())
+            words[1] = f" {value} "
+            line = "|".join(words)
+        lines.append(line)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    for name, value in remaining.items():
+        var_type = "int" if isinstance(value, int) else "string"
+        lines.append(f"{name} | {value} | {var_type} | set for ensemble member\n")
+    return "".join(lines)
+
+
+def write_tiled_config_files(cfg_filename, tile_columns, tile_rows, directory):
+    """Split the domain of a config file into tiles
+
+    Each tile writes its outputs (if the config file sets output_file) to a
+    file of its own, named after the tile by tile_output_file().
+
+    Parameters
+    ----------
+    cfg_filename : str or Path
+        Old-style config file of the whole domain.
+    tile_columns, tile_rows : int
+        Size of each tile.  Tiles along the right and bottom edges may be
+        smaller.
+    directory : str or Path
+        Folder to write one config file per tile into.
+
+    Returns
+    -------
+    list of Path
+        The config files, row by row.
+    """
+    if tile_columns < 1 or tile_rows < 1:
+        raise ValueError(f"bad tile shape ({tile_columns}, {tile_rows})")
+
+    cfg_text = pathlib.Path(cfg_filename).read_text()
+    cfg_struct = AlaskaTemperature().get_config_from_oldstyle_file(cfg_filename)
+    n_columns, n_rows = cfg_struct["grid_shape"]
+    i_skip = cfg_struct.get("i_skip", 1)
+    j_skip = cfg_struct.get("j_skip", 1)
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Paths in the config file are relative to it, so they are made absolute
+    cfg_directory = pathlib.Path(cfg_filename).parent.resolve()
+    paths = {
+        name: cfg_directory / cfg_struct[name]
+        for name in ("temperature_file", "site_file", "cache_directory")
+        if name in cfg_struct
+    }
+    if paths:
+        cfg_text = set_oldstyle_config_values(cfg_text, paths)
+    output_file = cfg_struct.get("output_file", None)
+    if output_file is not None:
+        output_file = cfg_directory / output_file
+
+    cfg_files = []
+    for j in range(0, n_rows, tile_rows):
+        for i in range(0, n_columns, tile_columns):
+            values = {
+                "i_ul": cfg_struct["i_ul"] + i * i_skip,
+                "j_ul": cfg_struct["j_ul"] + j * j_skip,
+                "grid_columns": min(tile_columns, n_columns - i),
+                "grid_rows": min(tile_rows, n_rows - j),
+            }
+            if output_file is not None:
+                # Each tile writes its own outputs, named after the tile
+                values["output_file"] = tile_output_file(output_file, j, i)
+            tile_text = set_oldstyle_config_values(cfg_text, values)
+            cfg_file = directory / f"tile_{j:04d}_{i:04d}.cfg"
+            cfg_file.write_text(tile_text)
+            cfg_files.append(cfg_file)
+    return cfg_files
+
+
+def tile_output_file(output_file, j, i):
+    """The output file of the tile whose first row and column are j and i
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.ensemble import tile_output_file
+    >>> tile_output_file("out/run.nc", 0, 15).as_posix()
+    'out/run_0000_0015.nc'
+    >>> tile_output_file("out/run", 8, 0).as_posix()
+    'out/run_0008_0000'
+    """
+    output_file = pathlib.Path(output_file)
+    if output_file.suffix == ".nc":
+        return output_file.with_name(f"{output_file.stem}_{j:04d}_{i:04d}.nc")
+    return output_file.with_name(f"{output_file.name}_{j:04d}_{i:04d}")
+
+
+def run_member(cfg_filename, until=None):
+    """Run one ensemble member and return its outputs
+
+    Parameters
+    ----------
+    cfg_filename : str or Path
+        Old-style config file of the member.
+    until : float, optional
+        Model time to run until.  The default is the end of the run.
+
+    Returns
+    -------
+    dict
+        The member's output values keyed by variable name, and the
+        position of its domain within the netcdf grid.
+    """
+    bmi = AlaskaTemperatureBMI()
+    bmi.initialize(cfg_file=cfg_filename)
+    try:
+        bmi.update_until(bmi.get_end_time() if until is None else until)
+        return {
+            "cfg_file": str(cfg_filename),
+            "i_ul": bmi._model._nc_i0,
+            "j_ul": bmi._model._nc_j0,
+            "i_skip": bmi._model._nc_iskip,
+            "j_skip": bmi._model._nc_jskip,
+            "time": bmi.get_current_time(),
+            "values": {
+                name: bmi.get_value_ref(name).copy()
+                for name in bmi.get_output_var_names()
+            },
+        }
+    finally:
+        bmi.finalize()
+
+
+def run_ensemble(cfg_filenames, until=None, max_workers=None):
+    """Run ensemble members in a pool of processes
+
+    Parameters
+    ----------
+    cfg_filenames : iterable of str or Path
+        Old-style config file of each member.
+    until : float, optional
+        Model time to run each member until.
+    max_workers : int, optional
+        Number of processes.  The default is the number of processors.
+
+    Returns
+    -------
+    list of dict
+        The outputs of each member (see run_member), in order.
+    """
+    cfg_filenames = [str(cfg_filename) for cfg_filename in cfg_filenames]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(
+            pool.map(run_member, cfg_filenames, [until] * len(cfg_filenames))
+        )
+
+
+def mosaic(results, var_name, fill_value=np.nan):
+    """Put the outputs of ensemble members that tile a domain together
+
+    Parameters
+    ----------
+    results : list of dict
+        Outputs of the members, as returned by run_ensemble.
+    var_name : str
+        The output variable to assemble.
+    fill_value : float, optional
+        Value of cells not covered by any member.
+
+    Returns
+    -------
+    ndarray
+        The variable over the bounding box of all members.
+    """
+    skips = {(result["i_skip"], result["j_skip"]) for result in results}
+    if len(skips) != 1:
+        raise ValueError("ensemble members must all have the same grid spacing")
+    i_skip, j_skip = skips.pop()
+
+    i0 = min(result["i_ul"] for result in results)
+    j0 = min(result["j_ul"] for result in results)
+    placements = []
+    for result in results:
+        values = result["values"][var_name]
+        row = (result["j_ul"] - j0) // j_skip
+        column = (result["i_ul"] - i0) // i_skip
+        placements.append((row, column, values))
+
+    n_rows = max(row + values.shape[0] for row, _, values in placements)
+    n_columns = max(column + values.shape[1] for _, column, values in placements)
+    merged = np.full((n_rows, n_columns), fill_value, dtype=np.float32)
+    for row, column, values in placements:
+        merged[row : row + values.shape[0], column : column + values.shape[1]] = values
+    return merged
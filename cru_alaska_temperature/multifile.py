@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Read a temperature record that is split in time across many netcdf files
+
+CRU NCEP archives are often distributed as one netcdf file per year or
+decade.  A MultiFileDataset stands in for a single netCDF4.Dataset of the
+whole record: its time variable is the concatenation of those of the files
+and its (time, y, x) variables are read from whichever files hold the
+requested months.  Only a few files are kept open at a time.
+"""
+import collections
+import datetime as dt
+import glob
+import pathlib
+
+import numpy as np
+
+from .readers import open_netcdf
+
+
+def has_wildcards(pattern):
+    """True if a path is a glob pattern
+
+    >>> from cru_alaska_temperature.multifile import has_wildcards
+    >>> has_wildcards("data/cru_*.nc"), has_wildcards("data/cru_1901.nc")
+    (True, False)
+    """
+    return any(c in str(pattern) for c in "*?[")
+
+
+def temperature_filenames(source):
+    """The netcdf files of a temperature record
+
+    Parameters
+    ----------
+    source : str or Path
+        A netcdf file, a glob pattern of netcdf files, or a manifest: a
+        text file (.txt) that lists one netcdf file per line.  Relative
+        paths in a manifest are relative to the manifest.
+
+    Returns
+    -------
+    Path or list of Path
+        The netcdf file, or the list of files of a pattern or manifest.
+    """
+    if has_wildcards(source):
+        filenames = [pathlib.Path(name) for name in sorted(glob.glob(str(source)))]
+        if not filenames:
+            raise ValueError(f"no temperature netcdf files match {source}")
+        return filenames
+
+    source = pathlib.Path(source)
+    if source.suffix == ".txt" and source.is_file():
+        filenames = []
+        for line in source.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                filenames.append(source.parent / line)
+        if not filenames:
+            raise ValueError(f"no temperature netcdf files listed in {source}")
+        return filenames
+    return source
+
+
+def open_temperature_dataset(filenames, max_open_files=4):
+    """Open one netcdf file, or a list of them as a MultiFileDataset"""
+    if isinstance(filenames, (list, tuple)):
+        return MultiFileDataset(filenames, max_open_files=max_open_files)
+    return open_netcdf(filenames, "r", mmap=True)
+
+
+def time_months(times, attributes):
+    """Months since year 0 of time values in days since a reference date
+
+    Returns
+    -------
+    ndarray or None
+        The month of each time, or None if the time units have no
+        YYYY-MM-DD reference date.
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.multifile import time_months
+    >>> time_months([15, 45, 410], {"time_units": "days since 1900-01-01"})
+    array([22800, 22801, 22813])
+    """
+    units = attributes.get("time_units", attributes.get("units", ""))
+    for part in str(units).split():
+        try:
+            reference = dt.datetime.strptime(part, "%Y-%m-%d")
+        except ValueError:
+            # Most parts of the units are not a date
+            continue
+        dates = (
+            np.datetime64(reference, "D") + np.asarray(times).astype("timedelta64[D]")
+        ).astype("datetime64[M]")
+        return dates.astype(np.int64) + 1970 * 12
+    return None
+
+
+def check_consecutive_months(times, attributes, filenames):
+    """Raise ValueError unless files hold consecutive months
+
+    Parameters
+    ----------
+    times : list of ndarray
+        The time values of each file, in order.
+    attributes : dict
+        Attributes of the time variables.
+    filenames : list of Path
+        The files.
+    """
+    months = [time_months(values, attributes) for values in times]
+    if any(m is None for m in months):
+        return
+
+    def month_name(month):
+        return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+    previous = None
+    for k, (file_months, filename) in enumerate(zip(months, filenames)):
+        steps = np.diff(file_months)
+        if len(steps) and (steps != 1).any():
+            n = int(np.argmax(steps != 1))
+            raise ValueError(
+                f"{filename} skips from {month_name(file_months[n])} to "
+                f"{month_name(file_months[n + 1])}"
+            )
+        if previous is not None and len(file_months):
+            last = months[previous][-1]
+            if file_months[0] <= last:
+                raise ValueError(
+                    f"{filename} starts at {month_name(file_months[0])}, which "
+                    f"{filenames[previous]} also holds"
+                )
+            if file_months[0] != last + 1:
+                raise ValueError(
+                    f"months {month_name(last + 1)} to "
+                    f"{month_name(file_months[0] - 1)} are missing between "
+                    f"{filenames[previous]} and {filename}"
+                )
+        if len(file_months):
+            previous = k
+
+
+class MultiFileDataset:
+    """A list of netcdf files, each holding consecutive months of a record
+
+    Every file must have the same grid and time units.  The files are put
+    in order of their first time value, and together must hold one record
+    of consecutive months, without gaps or overlaps.  Each file is opened
+    once to read its time values and is then only reopened when months it
+    holds are read.
+
+    Parameters
+    ----------
+    filenames : list of str or Path
+        The netcdf files.
+    max_open_files : int, optional
+        Number of files kept open.  The least recently read file is closed
+        when another must be opened.
+    """
+
+    def __init__(self, filenames, max_open_files=4):
+        if max_open_files < 1:
+            raise ValueError(f"max_open_files must be at least 1 ({max_open_files})")
+        self.max_open_files = max_open_files
+        self._datasets = collections.OrderedDict()
+        self._chunk_caches = {}
+
+        times = {}
+        for filename in filenames:
+            with open_netcdf(filename, "r") as nc_file:
+                time = nc_file.variables["time"]
+                times[pathlib.Path(filename)] = (
+                    np.asarray(time[:]),
+                    {name: time.getncattr(name) for name in time.ncattrs()},
+                )
+        self.filenames = sorted(times, key=lambda name: times[name][0][0])
+        if len({repr(times[name][1]) for name in self.filenames}) != 1:
+            raise ValueError("temperature netcdf files have different time units")
+        self._offsets = np.cumsum([0] + [len(times[n][0]) for n in self.filenames])
+        check_consecutive_months(
+            [times[name][0] for name in self.filenames],
+            times[self.filenames[0]][1],
+            self.filenames,
+        )
+
+        first = self.dataset(0)
+        self.layout = getattr(first, "layout", None)
+        record_dimension = first.variables["time"].dimensions[0]
+        self.variables = {
+            "time": VirtualTime(
+                np.concatenate([times[name][0] for name in self.filenames]),
+                times[self.filenames[0]][1],
+            )
+        }
+        for name, variable in first.variables.items():
+            if name == "time":
+                continue
+            if variable.dimensions[:1] == (record_dimension,):
+                self.variables[name] = MultiFileVariable(self, name, variable)
+            else:
+                self.variables[name] = FileVariable(self, name, variable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def dataset(self, k):
+        """The open netcdf file k, opening it if needed"""
+        if k in self._datasets:
+            self._datasets.move_to_end(k)
+            return self._datasets[k]
+
+        while len(self._datasets) >= self.max_open_files:
+            self._datasets.popitem(last=False)[1].close()
+        nc_file = open_netcdf(self.filenames[k], "r", mmap=True)
+        for name, cache in self._chunk_caches.items():
+            nc_file.variables[name].set_var_chunk_cache(**cache)
+        self._datasets[k] = nc_file
+        return nc_file
+
+    @property
+    def open_files(self):
+        """Indices of the files that are open, least recently used first"""
+        return list(self._datasets)
+
+    def close(self):
+        """Close every open file"""
+        while self._datasets:
+            self._datasets.popitem()[1].close()
+
+
+class VirtualTime:
+    """The time variable of a MultiFileDataset"""
+
+    def __init__(self, values, attributes):
+        self._values = values
+        self._attributes = attributes
+        self.dimensions = ("time",)
+        self.shape = values.shape
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def ncattrs(self):
+        return list(self._attributes)
+
+    def getncattr(self, name):
+        return self._attributes[name]
+
+
+class FileVariable:
+    """A variable without a time dimension, read from the first file"""
+
+    def __init__(self, dataset, name, variable):
+        self._dataset = dataset
+        self.name = name
+        self.shape = variable.shape
+        self.ndim = variable.ndim
+        self.dtype = variable.dtype
+        self.dimensions = variable.dimensions
+
+    def __getitem__(self, key):
+        return self._dataset.dataset(0).variables[self.name][key]
+
+
+class MultiFileVariable(FileVariable):
+    """A variable whose first dimension is split across the files"""
+
+    def __init__(self, dataset, name, variable):
+        super().__init__(dataset, name, variable)
+        self.shape = (int(dataset._offsets[-1]),) + tuple(variable.shape[1:])
+        self._chunking = variable.chunking()
+
+    def chunking(self):
+        """Chunk shape of the first file"""
+        return self._chunking
+
+    def set_var_chunk_cache(self, **kwds):
+        """Set the chunk cache of the variable in every file"""
+        self._dataset._chunk_caches[self.name] = kwds
+        for nc_file in self._dataset._datasets.values():
+            nc_file.variables[self.name].set_var_chunk_cache(**kwds)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if isinstance(key[0], (int, np.integer)):
+            return self[(slice(key[0], key[0] + 1),) + key[1:]][0]
+
+        months = np.arange(self.shape[0])[key[0]]
+        values = np.empty((len(months),) + self._other_shape(key[1:]), self.dtype)
+        files = np.searchsorted(self._dataset._offsets, months, side="right") - 1
+        for k in np.unique(files):
+            in_file = np.flatnonzero(files == k)
+            local = months[in_file] - self._dataset._offsets[k]
+            step = int(local[1] - local[0]) if len(local) > 1 else 1
+            if step > 0:
+                local = slice(local[0], local[-1] + 1, step)
+            else:
+                local = local.tolist()
+            variable = self._dataset.dataset(k).variables[self.name]
+            values[in_file] = variable[(local,) + key[1:]]
+        return values
+
+    def _other_shape(self, key):
+        shape = []
+        for size, k in zip(self.shape[1:], key + (slice(None),) * self.ndim):
+            if isinstance(k, slice):
+                shape.append(len(range(*k.indices(size))))
+        return tuple(shape)
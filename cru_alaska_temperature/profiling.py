@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Low-overhead timers and counters for the phases of a model run
+
+Profiling is off by default.  A disabled Profiler hands out a shared no-op
+context manager, so instrumented code costs one attribute lookup and call
+per phase.
+
+Examples
+--------
+>>> from cru_alaska_temperature.profiling import Profiler
+>>> profiler = Profiler(enabled=True)
+>>> with profiler.phase("read"):
+...     profiler.add_bytes_read("read", 1024)
+>>> report = profiler.report()
+>>> report["read"]["calls"], report["read"]["bytes_read"]
+(1, 1024)
+>>> Profiler().phase("read") is Profiler().phase("write")
+True
+"""
+import functools
+import time
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, stats):
+        self._stats = stats
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._stats["seconds"] += time.perf_counter() - self._start
+        self._stats["calls"] += 1
+        return False
+
+
+class Profiler:
+    """Accumulate wall time, bytes read and arrays allocated per phase
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Record phases.  A disabled profiler records nothing.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._phases = {}
+
+    def _stats(self, name):
+        if name not in self._phases:
+            self._phases[name] = {
+                "calls": 0,
+                "seconds": 0.0,
+                "bytes_read": 0,
+                "arrays_allocated": 0,
+                "bytes_allocated": 0,
+            }
+        return self._phases[name]
+
+    def phase(self, name):
+        """Context manager that times one call of a phase"""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self._stats(name))
+
+    def record(self, name, seconds, calls=1):
+        """Add time measured elsewhere to a phase"""
+        if self.enabled:
+            stats = self._stats(name)
+            stats["seconds"] += seconds
+            stats["calls"] += calls
+
+    def add_bytes_read(self, name, nbytes):
+        """Count bytes read from a file during a phase"""
+        if self.enabled:
+            self._stats(name)["bytes_read"] += int(nbytes)
+
+    def count_allocation(self, name, array):
+        """Count an array allocated during a phase"""
+        if self.enabled:
+            stats = self._stats(name)
+            stats["arrays_allocated"] += 1
+            stats["bytes_allocated"] += array.nbytes
+
+    def report(self):
+        """The statistics of each phase, keyed by phase name"""
+        return {name: dict(stats) for name, stats in self._phases.items()}
+
+    def reset(self):
+        """Drop all statistics"""
+        self._phases.clear()
+
+
+def profiled(name):
+    """Decorate a method so that each call is timed as a phase
+
+    The instance must have a _profiler attribute.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwds):
+            profiler = self._profiler
+            if not profiler.enabled:
+                return method(self, *args, **kwds)
+            with profiler.phase(name):
+                return method(self, *args, **kwds)
+
+        return wrapper
+
+    return decorator
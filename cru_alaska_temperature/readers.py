@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Readers that provide monthly temperature fields from a CRU NCEP netcdf
+file without loading the entire record into memory
+"""
+import concurrent.futures
+import threading
+import time
+
+import numpy as np
+
+# The netCDF and HDF5 libraries are not thread-safe, so reads and writes
+# that may run alongside a prefetching reader hold this lock
+netcdf_lock = threading.Lock()
+
+
+def open_netcdf(filename, mode="r", **kwds):
+    """Open a netCDF4.Dataset, importing netCDF4 when first needed"""
+    from netCDF4 import Dataset
+
+    return Dataset(filename, mode, **kwds)
+
+
+# Chunk layouts of the temperature variable (see the repack module)
+LAYOUTS = ("map", "timeseries")
+
+
+class ReadPlan:
+    """Plan chunk-aligned reads of a window of a (time, y, x) netcdf variable
+
+    Reading a strided window such as ``temp[:, j0:j1:2, i0:i1:2]`` through
+    netCDF4 decompresses every chunk the window touches, for each read that
+    touches it, while returning only part of the data.  A plan instead reads
+    the contiguous box around the window, a whole number of time chunks at
+    a time, and takes the stride in memory.  The variable's chunk cache is
+    sized to hold every chunk of one read, so that each chunk is
+    decompressed only once.
+
+    Parameters
+    ----------
+    variable : netCDF4.Variable
+        The (time, y, x) variable.
+    window : tuple of slice
+        The (y, x) slices of the model domain within the netcdf grid.
+    months_per_read : int, optional
+        Number of months read at once, rounded up to whole time chunks.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from cru_alaska_temperature.readers import ReadPlan
+    >>> class Variable:
+    ...     shape, dtype = (24, 10, 10), np.dtype("float32")
+    ...     def chunking(self): return [12, 5, 5]
+    ...     def set_var_chunk_cache(self, **kwds): pass
+    >>> plan = ReadPlan(Variable(), (slice(0, 6, 2), slice(2, 4)), months_per_read=1)
+    >>> plan.shape, plan.months_per_read
+    ((24, 3, 2), 12)
+    >>> plan.bytes_used(0, 12), plan.bytes_decompressed(0, 12)
+    (288, 1200)
+    """
+
+    def __init__(self, variable, window, months_per_read=12):
+        nt, ny, nx = variable.shape
+        chunking = variable.chunking()
+        if chunking == "contiguous":
+            chunking = (1, ny, nx)
+        self.chunk_shape = tuple(int(size) for size in chunking)
+        self.itemsize = np.dtype(variable.dtype).itemsize
+        self._variable = variable
+
+        rows = range(*window[0].indices(ny))
+        columns = range(*window[1].indices(nx))
+        if len(rows) == 0 or len(columns) == 0 or rows.step < 0 or columns.step < 0:
+            raise ValueError(f"window must be non-empty and increasing ({window})")
+        self.shape = (nt, len(rows), len(columns))
+
+        # The box around the window is read and then subsampled in memory
+        self._box = (
+            slice(rows[0], rows[-1] + 1),
+            slice(columns[0], columns[-1] + 1),
+        )
+        self._subsample = (
+            slice(None),
+            slice(None, None, rows.step),
+            slice(None, None, columns.step),
+        )
+
+        chunk_t = self.chunk_shape[0]
+        self.months_per_read = chunk_t * -(-max(months_per_read, 1) // chunk_t)
+        self.set_chunk_cache()
+
+        # Totals of the reads made so far: the netcdf reads (which
+        # decompress), and copying the strided window out as float32
+        self.n_reads = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.copy_seconds = 0.0
+
+    def chunks_touched(self, start, stop):
+        """Number of chunks that a read of months start to stop decompresses"""
+        n_chunks = 1
+        for (lower, upper), size in zip(
+            ((start, stop),) + tuple((s.start, s.stop) for s in self._box),
+            self.chunk_shape,
+        ):
+            n_chunks *= (upper - 1) // size - lower // size + 1
+        return n_chunks
+
+    def bytes_decompressed(self, start, stop):
+        """Bytes of chunks decompressed to read months start to stop"""
+        chunk_bytes = self.itemsize * int(np.prod(self.chunk_shape))
+        return self.chunks_touched(start, stop) * chunk_bytes
+
+    def bytes_used(self, start, stop):
+        """Bytes of the window for months start to stop"""
+        return (stop - start) * self.shape[1] * self.shape[2] * self.itemsize
+
+    def set_chunk_cache(self):
+        """Size the variable's chunk cache to hold the chunks of one read"""
+        n_chunks = self.chunks_touched(0, self.months_per_read)
+        chunk_bytes = self.itemsize * int(np.prod(self.chunk_shape))
+        # netCDF recommends a prime number of hash slots, well above the
+        # number of chunks held
+        with netcdf_lock:
+            self._variable.set_var_chunk_cache(
+                size=max(n_chunks * chunk_bytes, 1 << 20),
+                nelems=_next_prime(max(10 * n_chunks, 521)),
+                preemption=0.75,
+            )
+
+    def block_start(self, time_index):
+        """The first month of the read that holds time_index"""
+        return time_index - time_index % self.months_per_read
+
+    def read(self, start, stop, out=None):
+        """Read the window for months start to stop as float32"""
+        if out is None:
+            out = np.empty((stop - start,) + self.shape[1:], dtype=np.float32)
+        for t0 in range(start, stop, self.months_per_read):
+            t1 = min(t0 + self.months_per_read, stop)
+            started = time.perf_counter()
+            with netcdf_lock:
+                box = np.asarray(self._variable[(slice(t0, t1),) + self._box])
+            read = time.perf_counter()
+            out[t0 - start : t1 - start] = box[self._subsample]
+            self.read_seconds += read - started
+            self.copy_seconds += time.perf_counter() - read
+            self.bytes_read += box.nbytes
+            self.n_reads += 1
+        return out
+
+    def close(self):
+        """Release the netcdf variable"""
+        self._variable = None
+
+
+def _next_prime(n):
+    """The smallest prime number no less than n
+
+    >>> from cru_alaska_temperature.readers import _next_prime
+    >>> _next_prime(520), _next_prime(521)
+    (521, 521)
+    """
+    while any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def detect_layout(nc_file, var_name="temp"):
+    """The layout of a variable in a netcdf file
+
+    The ``layout`` global attribute written by repack() is used if present.
+    Otherwise the layout is guessed from the variable's chunking: chunks
+    spanning more than one month are taken to be a timeseries layout.
+
+    Parameters
+    ----------
+    nc_file : netCDF4.Dataset
+        An open netcdf file.
+    var_name : str, optional
+        Name of the (time, y, x) variable.
+
+    Returns
+    -------
+    str
+        'map' or 'timeseries'.
+    """
+    layout = getattr(nc_file, "layout", None)
+    if layout in LAYOUTS:
+        return layout
+    chunking = nc_file.variables[var_name].chunking()
+    if chunking != "contiguous" and chunking[0] > 1:
+        return "timeseries"
+    return "map"
+
+
+class StreamingTemperatureReader:
+    """Read monthly temperature fields from a netcdf variable on demand
+
+    Only a bounded block of consecutive months is held in memory.  When a
+    month outside of that block is requested, the block holding that month
+    is read from the file with a ReadPlan.  Blocks start on time chunk
+    boundaries, so that a model stepping forward in time decompresses each
+    chunk of the record only once.
+
+    With prefetch, the block after the current one is read by a background
+    thread into a second buffer while the model works on the current one,
+    so that a model stepping forward rarely waits for a read.  Fields
+    returned by a prefetching reader are views of its buffers and are only
+    valid until the next block is used.
+
+    Parameters
+    ----------
+    variable : netCDF4.Variable
+        The (time, y, x) temperature variable.
+    window : tuple of slice
+        The (y, x) slices of the model domain within the netcdf grid.
+    block_size : int, optional
+        Number of months read at once (and held in memory), rounded up to
+        whole time chunks.
+    prefetch : bool, optional
+        Read the next block in a background thread.
+    """
+
+    def __init__(self, variable, window, block_size=24, prefetch=False):
+        if block_size < 1:
+            raise ValueError(f"block_size must be at least 1 ({block_size})")
+        self._plan = ReadPlan(variable, window, months_per_read=block_size)
+        self._block = None
+        self._block_start = 0
+
+        self.shape = self._plan.shape
+        self.dtype = np.dtype(np.float32)
+
+        # Two preallocated buffers: the current block and the next one
+        self._executor = None
+        self._pending = None
+        self._pending_start = None
+        if prefetch:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._buffers = [
+                np.empty((self._plan.months_per_read,) + self.shape[1:], np.float32)
+                for _ in range(2)
+            ]
+
+    @property
+    def plan(self):
+        """The ReadPlan of the reader's blocks"""
+        return self._plan
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """Return the (y, x) temperature field for time index idx"""
+        idx = int(idx)
+        if idx < 0:
+            idx += self.shape[0]
+        if not 0 <= idx < self.shape[0]:
+            raise IndexError(f"time index out of range ({idx})")
+
+        if (
+            self._block is None
+            or idx < self._block_start
+            or idx >= self._block_start + len(self._block)
+        ):
+            self._read_block(self._plan.block_start(idx))
+
+        return self._block[idx - self._block_start]
+
+    def _read_block(self, start):
+        stop = min(start + self._plan.months_per_read, self.shape[0])
+        if self._executor is None:
+            self._block = self._plan.read(start, stop)
+            self._block_start = start
+            return
+
+        # The spare buffer is the one the pending read (if any) fills
+        spare = self._buffers[1]
+        pending_start = self._pending_start
+        self._wait_for_prefetch()
+        if pending_start != start:
+            self._plan.read(start, stop, out=spare[: stop - start])
+        self._buffers.reverse()
+        self._block = spare[: stop - start]
+        self._block_start = start
+
+        next_start = start + self._plan.months_per_read
+        if next_start < self.shape[0]:
+            next_stop = min(next_start + self._plan.months_per_read, self.shape[0])
+            self._pending_start = next_start
+            self._pending = self._executor.submit(
+                self._plan.read,
+                next_start,
+                next_stop,
+                out=self._buffers[1][: next_stop - next_start],
+            )
+
+    def _wait_for_prefetch(self):
+        if self._pending is not None:
+            pending, self._pending, self._pending_start = self._pending, None, None
+            pending.result()
+
+    def close(self):
+        """Release the netcdf variable and the cached block"""
+        if self._executor is not None:
+            self._wait_for_prefetch()
+            self._executor.shutdown()
+            self._executor = None
+        self._plan.close()
+        self._block = None
+
+
+def read_site_series(variable, j, i, months_per_read=120):
+    """Read the full time series of a set of cells of a netcdf variable
+
+    Cells are grouped by the chunk of the variable that holds them and each
+    group is read as the smallest box around its cells, a block of months at
+    a time, so that every chunk is decompressed once and memory is bounded
+    by the size of one box.
+
+    Parameters
+    ----------
+    variable : netCDF4.Variable
+        The (time, y, x) temperature variable.
+    j, i : ndarray of int
+        Row and column of each cell.
+    months_per_read : int, optional
+        Number of months read at once, rounded up to whole chunks.
+
+    Returns
+    -------
+    ndarray
+        The (time, cell) temperatures as float32.
+    """
+    j = np.asarray(j)
+    i = np.asarray(i)
+    nt, ny, nx = variable.shape
+    chunking = variable.chunking()
+    if chunking == "contiguous":
+        chunking = (1, ny, nx)
+    chunk_t, chunk_y, chunk_x = chunking
+    months_per_read = chunk_t * -(-months_per_read // chunk_t)
+
+    values = np.empty((nt, len(j)), dtype=np.float32)
+    tiles = (j // chunk_y) * -(-nx // chunk_x) + i // chunk_x
+    for tile in np.unique(tiles):
+        cells = np.flatnonzero(tiles == tile)
+        j0, j1 = j[cells].min(), j[cells].max() + 1
+        i0, i1 = i[cells].min(), i[cells].max() + 1
+        for t0 in range(0, nt, months_per_read):
+            t1 = min(t0 + months_per_read, nt)
+            box = np.asarray(variable[t0:t1, j0:j1, i0:i1])
+            values[t0:t1, cells] = box[:, j[cells] - j0, i[cells] - i0]
+    return values
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Rewrite a CRU NCEP temperature netcdf file with chunking chosen for how it
+will be read
+
+Two layouts are supported:
+
+map
+    Each chunk holds all or a large tile of the grid for one month, so that
+    stepping the model forward (reading one map per month) decompresses
+    nothing it doesn't use.
+
+timeseries
+    Each chunk holds the full record of a small tile of cells, so that
+    reading the time series of a few sites decompresses only the tiles that
+    hold them.
+
+The layout is recorded in the file's ``layout`` global attribute, which
+AlaskaTemperature reads to pick how it reads the file.
+
+Usage: cru-alaska-repack SOURCE DESTINATION --layout {map,timeseries}
+"""
+import argparse
+
+import numpy as np
+from netCDF4 import Dataset
+
+from .readers import LAYOUTS
+
+
+def chunk_shape_for_layout(layout, shape, itemsize=4, chunk_bytes=4 << 20):
+    """Chunk shape of a (time, y, x) variable for an access pattern
+
+    Parameters
+    ----------
+    layout : {'map', 'timeseries'}
+        How the variable will be read.
+    shape : tuple of int
+        The (time, y, x) shape of the variable.
+    itemsize : int, optional
+        Bytes per value.
+    chunk_bytes : int, optional
+        Largest (uncompressed) size of a chunk.
+
+    Returns
+    -------
+    tuple of int
+        The chunk shape.
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.repack import chunk_shape_for_layout
+    >>> chunk_shape_for_layout("map", (1308, 80, 120))
+    (1, 80, 120)
+    >>> chunk_shape_for_layout("timeseries", (1308, 80, 120))
+    (1308, 28, 28)
+    >>> chunk_shape_for_layout("map", (1308, 2000, 3000))
+    (1, 1024, 1024)
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {', '.join(LAYOUTS)} ({layout})")
+    nt, ny, nx = shape
+
+    if layout == "map":
+        n_time = 1
+    else:
+        n_time = nt
+    # Square tiles of cells, as large as fit in a chunk
+    n_cells = max(chunk_bytes // (itemsize * n_time), 1)
+    side = max(int(np.sqrt(n_cells)), 1)
+    if layout == "map" and ny * nx <= n_cells:
+        return (n_time, ny, nx)
+    if layout == "map":
+        # Powers of two keep map tiles aligned with windows of the grid
+        side = 1 << (side.bit_length() - 1)
+    return (n_time, min(side, ny), min(side, nx))
+
+
+def repack(
+    src_filename,
+    dst_filename,
+    layout,
+    var_name="temp",
+    complevel=4,
+    shuffle=True,
+    memory_bytes=512 << 20,
+):
+    """Copy a CRU NCEP netcdf file, rechunking one variable for a layout
+
+    Other variables, dimensions and attributes are copied as they are.
+
+    Parameters
+    ----------
+    src_filename, dst_filename : str or Path
+        The netcdf files to read and write.
+    layout : {'map', 'timeseries'}
+        How the variable will be read.
+    var_name : str, optional
+        Name of the (time, y, x) variable to rechunk.
+    complevel : int, optional
+        zlib compression level of the variable, from 0 (none) to 9.
+    shuffle : bool, optional
+        Apply the HDF5 shuffle filter before compressing.
+    memory_bytes : int, optional
+        Approximate size of the blocks copied at once.
+
+    Returns
+    -------
+    tuple of int
+        The chunk shape of the rechunked variable.
+    """
+    with Dataset(src_filename, "r") as src, Dataset(
+        dst_filename, "w", format="NETCDF4"
+    ) as dst:
+        dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+        dst.setncattr("layout", layout)
+        for name, dimension in src.dimensions.items():
+            dst.createDimension(
+                name, None if dimension.isunlimited() else len(dimension)
+            )
+
+        for name, variable in src.variables.items():
+            if name == var_name:
+                continue
+            fill_value = getattr(variable, "_FillValue", None)
+            copy = dst.createVariable(
+                name,
+                variable.datatype,
+                variable.dimensions,
+                zlib=complevel > 0,
+                complevel=complevel,
+                fill_value=fill_value,
+            )
+            _copy_attributes(variable, copy)
+            copy.set_auto_maskandscale(False)
+            variable.set_auto_maskandscale(False)
+            copy[...] = variable[...]
+
+        variable = src.variables[var_name]
+        chunks = chunk_shape_for_layout(
+            layout, variable.shape, itemsize=variable.dtype.itemsize
+        )
+        copy = dst.createVariable(
+            var_name,
+            variable.datatype,
+            variable.dimensions,
+            zlib=complevel > 0,
+            complevel=complevel,
+            shuffle=shuffle,
+            chunksizes=chunks,
+            fill_value=getattr(variable, "_FillValue", None),
+        )
+        _copy_attributes(variable, copy)
+        copy.set_auto_maskandscale(False)
+        variable.set_auto_maskandscale(False)
+
+        # Copy whole chunks of the new layout at a time: blocks of months
+        # for maps, bands of rows for time series
+        nt, ny, nx = variable.shape
+        row_bytes = variable.dtype.itemsize * nx
+        if layout == "map":
+            step = max(memory_bytes // (row_bytes * ny), 1)
+            for t0 in range(0, nt, step):
+                copy[t0 : t0 + step] = variable[t0 : t0 + step]
+        else:
+            step = max(memory_bytes // (row_bytes * nt) // chunks[1], 1) * chunks[1]
+            for j0 in range(0, ny, step):
+                copy[:, j0 : j0 + step] = variable[:, j0 : j0 + step]
+    return chunks
+
+
+def _copy_attributes(src, dst):
+    # _FillValue can only be set when a variable is created
+    dst.setncatts(
+        {name: src.getncattr(name) for name in src.ncattrs() if name != "_FillValue"}
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rechunk a CRU NCEP temperature netcdf file for an access pattern"
+    )
+    parser.add_argument("source", help="netcdf file to read")
+    parser.add_argument("destination", help="netcdf file to write")
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        default="map",
+        help="map: one map per month (model updates); "
+        "timeseries: full records of small tiles (site extraction)",
+    )
+    parser.add_argument("--var", default="temp", help="variable to rechunk")
+    parser.add_argument(
+        "--complevel", type=int, default=4, help="zlib compression level (0-9)"
+    )
+    parser.add_argument(
+        "--no-shuffle", action="store_true", help="don't apply the shuffle filter"
+    )
+    args = parser.parse_args(argv)
+
+    chunks = repack(
+        args.source,
+        args.destination,
+        args.layout,
+        var_name=args.var,
+        complevel=args.complevel,
+        shuffle=not args.no_shuffle,
+    )
+    print(f"wrote {args.destination} with {args.var} chunks {chunks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Map geographic coordinates to cells of the CRU NCEP netcdf grid
+"""
+import numpy as np
+
+
+def unit_vectors(lat, lon):
+    """Convert latitudes and longitudes (in degrees) to points on a unit sphere
+
+    Examples
+    --------
+    >>> from cru_alaska_temperature.spatial import unit_vectors
+    >>> unit_vectors([0.0, 90.0], [0.0, 0.0]).round(6)
+    array([[1., 0., 0.],
+           [0., 0., 1.]])
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1
+    )
+
+
+class GridLocator:
+    """Find the grid cells nearest to geographic coordinates
+
+    Cells are placed on the unit sphere and binned into cubes.  If the
+    nearest cell found in the 27 cubes around a point is within one cube
+    side of it, no other cell can be nearer, so each query only compares
+    the point to the few cells in those cubes.  The spacing of cells varies
+    (on a latitude/longitude grid they converge towards the pole), so cells
+    are binned at several cube sizes, from the finest spacing between
+    neighboring cells to the coarsest.  Each point is looked up with the
+    smallest cubes first and with larger ones only if its nearest cell was
+    not found, so that cubes never hold many more cells than needed.
+    Points farther from the grid than the largest cube are compared to
+    every cell.
+
+    Parameters
+    ----------
+    grid_lat, grid_lon : array_like
+        Latitude and longitude of each cell, in degrees.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from cru_alaska_temperature.spatial import GridLocator
+    >>> lon, lat = np.meshgrid(np.arange(-150.0, -140.0), np.arange(60.0, 65.0))
+    >>> locator = GridLocator(lat, lon)
+    >>> locator.nearest([61.2, 64.9], [-147.6, -140.2])
+    (array([1, 4]), array([2, 9]))
+    """
+
+    # Most cube sizes kept, each half the size of the next
+    max_levels = 12
+
+    def __init__(self, grid_lat, grid_lon):
+        self.shape = np.shape(grid_lat)
+        cells = unit_vectors(grid_lat, grid_lon)
+
+        # Distance from each cell to its farthest neighbor along the axes
+        spacing = np.zeros(cells.shape[:-1])
+        for axis in range(cells.ndim - 1):
+            if cells.shape[axis] > 1:
+                steps = np.linalg.norm(np.diff(cells, axis=axis), axis=-1)
+                before = [(0, 0)] * steps.ndim
+                before[axis] = (1, 0)
+                after = [(0, 0)] * steps.ndim
+                after[axis] = (0, 1)
+                spacing = np.maximum(spacing, np.pad(steps, before))
+                spacing = np.maximum(spacing, np.pad(steps, after))
+
+        self._cells = cells.reshape((-1, 3))
+        coarsest = spacing.max() * np.sqrt(2.0)
+        finest = spacing[spacing > 0].min() * np.sqrt(2.0) if coarsest > 0 else 1.0
+        bin_sizes = [coarsest if coarsest > 0 else 1.0]
+        while bin_sizes[0] / 2 >= finest and len(bin_sizes) < self.max_levels:
+            bin_sizes.insert(0, bin_sizes[0] / 2)
+        self._levels = [_CubeIndex(self._cells, size) for size in bin_sizes]
+
+    def nearest(self, lat, lon, chunk_size=8192):
+        """Find the cells nearest to a set of points
+
+        Parameters
+        ----------
+        lat, lon : array_like
+            Latitude and longitude of each point, in degrees.
+        chunk_size : int, optional
+            Number of points located at once.
+
+        Returns
+        -------
+        tuple of ndarray
+            The index of the nearest cell along each axis of the grid.
+        """
+        points = unit_vectors(np.ravel(lat), np.ravel(lon))
+        nearest = np.empty(len(points), dtype=np.intp)
+        for start in range(0, len(points), chunk_size):
+            nearest[start : start + chunk_size] = self._nearest_flat(
+                points[start : start + chunk_size]
+            )
+        return np.unravel_index(nearest, self.shape)
+
+    def _nearest_flat(self, points):
+        nearest = np.empty(len(points), dtype=np.intp)
+        todo = np.arange(len(points))
+        for level in self._levels:
+            if len(todo) == 0:
+                break
+            found, similarity = level.nearest(points[todo], self._cells)
+            # The cubes are only sure to hold the nearest cell if it is
+            # within one cube side of the point
+            chord = np.sqrt(np.maximum(2.0 - 2.0 * similarity, 0.0))
+            done = chord <= level.bin_size
+            nearest[todo[done]] = found[done]
+            todo = todo[~done]
+        if len(todo) > 0:
+            nearest[todo] = self._nearest_exhaustive(points[todo])
+        return nearest
+
+    def _nearest_exhaustive(self, points, chunk_size=1024):
+        cells = np.ascontiguousarray(self._cells.T)
+        nearest = np.empty(len(points), dtype=np.intp)
+        for start in range(0, len(points), chunk_size):
+            similarity = points[start : start + chunk_size] @ cells
+            nearest[start : start + chunk_size] = similarity.argmax(axis=1)
+        return nearest
+
+
+class _CubeIndex:
+    """Cells binned into cubes of one size
+
+    Parameters
+    ----------
+    cells : ndarray
+        (n, 3) unit vectors of the cells.
+    bin_size : float
+        Side of the cubes.
+    max_candidates : int, optional
+        Number of cells compared to points at once, which bounds the memory
+        of a lookup.
+    """
+
+    _OFFSETS = np.stack(
+        np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij"), axis=-1
+    ).reshape((-1, 3))
+
+    def __init__(self, cells, bin_size, max_candidates=1 << 20):
+        self.bin_size = bin_size
+        self.max_candidates = max_candidates
+        self._origin = cells.min(axis=0)
+        bins = self._bins(cells)
+        self._n_bins = bins.max(axis=0) + 1
+
+        keys = self._keys(bins)
+        self._order = np.argsort(keys, kind="stable")
+        self._bin_keys, self._bin_starts, self._bin_counts = np.unique(
+            keys[self._order], return_index=True, return_counts=True
+        )
+
+    def _bins(self, points):
+        return np.floor((points - self._origin) / self.bin_size).astype(np.int64)
+
+    def _keys(self, bins):
+        # Bins outside of those holding cells get a key of -1
+        outside = np.any((bins < 0) | (bins >= self._n_bins), axis=-1)
+        keys = (bins[..., 0] * self._n_bins[1] + bins[..., 1]) * self._n_bins[
+            2
+        ] + bins[..., 2]
+        return np.where(outside, -1, keys)
+
+    def nearest(self, points, cells):
+        """The nearest cell in the cubes around each point
+
+        Returns
+        -------
+        tuple of ndarray
+            The index of the cell, and its dot product with the point (-2
+            where the cubes hold no cells).
+        """
+        # Look up the cubes around each point
+        keys = self._keys(self._bins(points)[:, None, :] + self._OFFSETS)
+        position = np.searchsorted(self._bin_keys, keys).clip(
+            max=len(self._bin_keys) - 1
+        )
+        counts = np.where(self._bin_keys[position] == keys, self._bin_counts[position], 0)
+        starts = self._bin_starts[position]
+        totals = counts.sum(axis=1)
+
+        nearest = np.zeros(len(points), dtype=np.intp)
+        similarity = np.full(len(points), -2.0)
+        # Split the points so that each batch has a bounded number of
+        # candidate cells
+        ends = np.cumsum(totals)
+        first = 0
+        while first < len(points):
+            last = max(
+                np.searchsorted(ends, ends[first] - totals[first] + self.max_candidates),
+                first + 1,
+            )
+            batch = slice(first, last)
+            self._compare(
+                points[batch],
+                cells,
+                counts[batch].ravel(),
+                starts[batch].ravel(),
+                totals[batch],
+                nearest[batch],
+                similarity[batch],
+            )
+            first = last
+        return nearest, similarity
+
+    def _compare(self, points, cells, counts, starts, totals, nearest, similarity):
+        # The candidates of all points, one after another
+        n = counts.sum()
+        if n == 0:
+            return
+        ends = np.cumsum(counts)
+        index = np.repeat(starts - (ends - counts), counts) + np.arange(n)
+        candidates = self._order[index]
+        owner = np.repeat(np.arange(len(points)), totals)
+
+        # The nearest cell is the one with the largest dot product
+        dots = np.einsum("ck,ck->c", points[owner], cells[candidates])
+        has = totals > 0
+        segment_starts = (np.cumsum(totals) - totals)[has]
+        similarity[has] = np.maximum.reduceat(dots, segment_starts)
+        best = np.flatnonzero(dots == similarity[owner])
+        owners, first = np.unique(owner[best], return_index=True)
+        nearest[owners] = candidates[best[first]]
+
+
+def nearest_cells(grid_lat, grid_lon, lat, lon):
+    """Find the grid cells nearest to a set of points
+
+    Parameters
+    ----------
+    grid_lat, grid_lon : ndarray
+        (ny, nx) latitude and longitude of each cell, in degrees.
+    lat, lon : array_like
+        Latitude and longitude of each point, in degrees.
+
+    Returns
+    -------
+    tuple of ndarray
+        The j (row) and i (column) index of the cell nearest each point.
+    """
+    return GridLocator(grid_lat, grid_lon).nearest(lat, lon)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Hold a temperature record in memory at reduced precision
+
+A float32 record of a long run at high resolution is most of the memory
+used by the model.  It can instead be stored as float16, or as int16 packed
+with a scale factor and offset (as in the CF packing convention), halving
+its memory.  Values are decoded into float32 as they are read.
+"""
+import warnings
+
+import numpy as np
+
+STORAGE_MODES = ("float32", "float16", "int16")
+
+# int16 value that stands for a missing (NaN) temperature
+INT16_FILL = np.int16(-32768)
+
+
+def pack_temperature(values, storage="float32"):
+    """Store a temperature record in one of the storage modes
+
+    Parameters
+    ----------
+    values : ndarray
+        The float32 temperature record.
+    storage : {'float32', 'float16', 'int16'}, optional
+        How temperatures are held in memory.
+
+    Returns
+    -------
+    ndarray or PackedTemperature
+        The record itself for float32 storage, otherwise a PackedTemperature.
+    """
+    if storage not in STORAGE_MODES:
+        raise ValueError(
+            f"temperature_storage must be one of {', '.join(STORAGE_MODES)} "
+            f"({storage})"
+        )
+    if storage == "float32":
+        return values
+    if storage == "float16":
+        return PackedTemperature(np.asarray(values, dtype=np.float16))
+
+    values = np.asarray(values, dtype=np.float32)
+    with warnings.catch_warnings():
+        # The record may be all NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        vmin, vmax = float(np.nanmin(values)), float(np.nanmax(values))
+    if not np.isfinite([vmin, vmax]).all():
+        vmin = vmax = 0.0
+    # Valid values map onto -32767 to 32767, leaving -32768 for NaN
+    add_offset = (vmax + vmin) / 2
+    scale_factor = (vmax - vmin) / 65534 or 1.0
+    packed = np.empty(values.shape, dtype=np.int16)
+    for month, packed_month in zip(values, packed):
+        # A month at a time, to bound the memory of temporaries
+        scaled = np.rint((month - add_offset) / scale_factor)
+        packed_month[...] = np.where(np.isnan(scaled), INT16_FILL, scaled)
+    return PackedTemperature(packed, scale_factor, add_offset)
+
+
+class PackedTemperature:
+    """A temperature record stored as float16 or scaled int16
+
+    Indexing decodes the selected values into a new float32 array, and
+    decode() decodes into an existing one.  Temperatures of int16 records
+    are packed * scale_factor + add_offset, with INT16_FILL for NaN.
+
+    Parameters
+    ----------
+    packed : ndarray
+        The float16 or int16 values.
+    scale_factor, add_offset : float, optional
+        Packing of int16 values.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from cru_alaska_temperature.storage import pack_temperature
+    >>> record = pack_temperature(np.array([[-20.0, np.nan, 10.0]]), "int16")
+    >>> record.dtype, record.nbytes
+    (dtype('int16'), 6)
+    >>> record[0]
+    array([-20.,  nan,  10.], dtype=float32)
+    """
+
+    def __init__(self, packed, scale_factor=1.0, add_offset=0.0):
+        self._packed = packed
+        self.scale_factor = np.float32(scale_factor)
+        self.add_offset = np.float32(add_offset)
+        self._has_fill = packed.dtype == np.int16 and bool(
+            np.any(packed == INT16_FILL)
+        )
+
+    @property
+    def shape(self):
+        return self._packed.shape
+
+    @property
+    def dtype(self):
+        """The dtype in memory"""
+        return self._packed.dtype
+
+    @property
+    def nbytes(self):
+        return self._packed.nbytes
+
+    def __len__(self):
+        return len(self._packed)
+
+    def __getitem__(self, key):
+        packed = self._packed[key]
+        out = np.empty(np.shape(packed), dtype=np.float32)
+        return self._decode(packed, out)
+
+    def decode(self, key, out):
+        """Decode the values at key into a float32 array"""
+        return self._decode(self._packed[key], out)
+
+    def _decode(self, packed, out):
+        if packed.dtype == np.float16:
+            np.copyto(out, packed)
+            return out
+        np.multiply(packed, self.scale_factor, out=out)
+        out += self.add_offset
+        if self._has_fill:
+            out[packed == INT16_FILL] = np.nan
+        return out
+
+    def view(self):
+        """A new PackedTemperature of the same values"""
+        view = PackedTemperature.__new__(PackedTemperature)
+        view.__dict__.update(self.__dict__)
+        view._packed = self._packed.view()
+        return view
+
+    def setflags(self, write=None):
+        """Set the writeable flag of the packed values"""
+        self._packed.setflags(write=write)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+A process-wide store of decoded temperature records, so that many
+AlaskaTemperature instances reading the same data share one copy of it
+"""
+import collections
+import threading
+
+
+class TemperatureStore:
+    """Reference-counted, least-recently-used cache of read-only arrays
+
+    Arrays are created on first request by a loader function and handed out
+    as read-only views.  Each acquire() must be matched by a release().
+    Arrays that are no longer referenced are kept until more than
+    max_entries arrays are stored, at which point the least recently used
+    unreferenced arrays are dropped.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Number of arrays to keep once they are no longer referenced.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from cru_alaska_temperature.store import TemperatureStore
+    >>> store = TemperatureStore(max_entries=1)
+    >>> a = store.acquire("a", lambda: np.zeros(3))
+    >>> b = store.acquire("a", lambda: np.ones(3))
+    >>> np.shares_memory(a, b), a.flags.writeable
+    (True, False)
+    >>> store.release("a"); store.release("a")
+    >>> _ = store.acquire("b", lambda: np.ones(3)); store.release("b")
+    >>> "a" in store, "b" in store
+    (False, True)
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._arrays = collections.OrderedDict()
+        self._refcounts = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._arrays
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def acquire(self, key, load):
+        """Return a read-only view of the array for key, loading it if needed"""
+        with self._lock:
+            if key not in self._arrays:
+                array = load()
+                array.setflags(write=False)
+                self._arrays[key] = array
+                self._refcounts[key] = 0
+            self._arrays.move_to_end(key)
+            self._refcounts[key] += 1
+            view = self._arrays[key].view()
+            self._evict()
+        return view
+
+    def release(self, key):
+        """Drop a reference to the array for key"""
+        with self._lock:
+            if self._refcounts.get(key, 0) < 1:
+                raise KeyError(f"no references to release ({key})")
+            self._refcounts[key] -= 1
+            self._evict()
+
+    def refcount(self, key):
+        """Number of unreleased references to the array for key"""
+        return self._refcounts.get(key, 0)
+
+    def clear(self):
+        """Drop all arrays that are not referenced"""
+        with self._lock:
+            for key in [k for k, n in self._refcounts.items() if n == 0]:
+                del self._arrays[key]
+                del self._refcounts[key]
+
+    def _evict(self):
+        unreferenced = [k for k in self._arrays if self._refcounts[k] == 0]
+        n_extra = len(self._arrays) - self.max_entries
+        for key in unreferenced[: max(n_extra, 0)]:
+            del self._arrays[key]
+            del self._refcounts[key]
+
+
+shared_store = TemperatureStore()
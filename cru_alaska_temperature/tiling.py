@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Run a domain too large to hold in memory as a sequence of tiles
+
+The domain of a config file is split into bands of rows (see
+write_tiled_config_files) that each fit in a memory budget.  Tiles are run
+one after another, and their outputs are written into .npy files of the
+whole domain as each tile finishes, so that memory use is bounded by one
+tile no matter the size of the domain.
+"""
+import pathlib
+import tempfile
+
+import numpy as np
+
+from .alaska_temperature import AlaskaTemperature
+from .ensemble import run_member, write_tiled_config_files
+from .multifile import open_temperature_dataset
+
+
+def bytes_per_cell(cfg_struct, nc_variable):
+    """Approximate memory used by the model for each cell of its grid
+
+    Parameters
+    ----------
+    cfg_struct : dict
+        The parsed config file.
+    nc_variable : netCDF4.Variable
+        The (time, y, x) temperature variable.
+
+    Returns
+    -------
+    int
+        Bytes per cell.
+    """
+    nt = nc_variable.shape[0]
+    chunking = nc_variable.chunking()
+    chunk_t = 1 if chunking == "contiguous" else chunking[0]
+
+    # Months of temperature held: the whole record, or a block of it
+    if cfg_struct.get("temperature_read_mode", "eager") == "streaming":
+        months = 12 + cfg_struct.get("read_ahead_months", 12)
+        months = min(chunk_t * -(-months // chunk_t), nt)
+    else:
+        months = nt
+    # Reads go through the box around the (possibly strided) window, a
+    # whole time chunk at a time
+    box_months = min(chunk_t * -(-12 // chunk_t), nt)
+    box_cells = cfg_struct.get("i_skip", 1) * cfg_struct.get("j_skip", 1)
+
+    # Temperatures as stored; float32 output grids and ring buffer; float64
+    # running sum.  Climate outputs add their grids, a degree day scratch
+    # grid, the climatology and two more running sums
+    storage = cfg_struct.get("temperature_storage", "float32")
+    record_bytes = months * (4 if storage == "float32" else 2)
+    cell_bytes = record_bytes + 4 * (box_months * box_cells + 4 + 12) + 8
+    climate_outputs = cfg_struct.get("climate_outputs", False)
+    if climate_outputs:
+        cell_bytes += 4 * (4 + 1 + 12) + 8 * 2
+
+    if cfg_struct.get("precompute_outputs", False):
+        # A series of every timestep: the mean grid, which isn't a view of
+        # the record, and its float64 temporary.  Climate outputs add the
+        # anomaly and degree day grids, and the float32 temporaries of the
+        # degree days
+        steps = -(-nt // (12 * max(cfg_struct.get("timestep", 1), 1)))
+        cell_bytes += steps * (4 + 8)
+        if climate_outputs:
+            cell_bytes += steps * (4 * 3 + 4 * 12 * 2)
+    return cell_bytes
+
+
+def tile_rows_for_budget(cfg_filename, memory_bytes):
+    """Number of rows of the domain that fit in a memory budget
+
+    Parameters
+    ----------
+    cfg_filename : str or Path
+        Old-style config file of the whole domain.
+    memory_bytes : int
+        Memory available to a tile.
+
+    Returns
+    -------
+    int
+        Rows per tile, at least one and at most the rows of the domain.
+    """
+    model = AlaskaTemperature()
+    cfg_struct = model.get_config_from_oldstyle_file(cfg_filename)
+    nc_filename = model.verify_temperature_netcdf_for_region_resolution(
+        cfg_struct, pathlib.Path(cfg_filename).parent
+    )
+    with open_temperature_dataset(nc_filename) as nc_file:
+        row_bytes = bytes_per_cell(cfg_struct, nc_file.variables["temp"])
+    n_columns, n_rows = cfg_struct["grid_shape"]
+    row_bytes *= n_columns
+
+    if row_bytes > memory_bytes:
+        raise ValueError(
+            f"a row of the domain needs {row_bytes} bytes, more than the "
+            f"memory budget ({memory_bytes})"
+        )
+    return min(memory_bytes // row_bytes, n_rows)
+
+
+def run_tiled(cfg_filename, memory_bytes, output_directory, until=None):
+    """Run the domain of a config file a tile at a time
+
+    Parameters
+    ----------
+    cfg_filename : str or Path
+        Old-style config file of the whole domain.
+    memory_bytes : int
+        Memory available to each tile.
+    output_directory : str or Path
+        Folder to write one <variable>.npy file of the domain into.
+    until : float, optional
+        Model time to run each tile until.  The default is the end of the
+        run.
+
+    Returns
+    -------
+    dict
+        Path of the output file of each output variable.
+    """
+    cfg_struct = AlaskaTemperature().get_config_from_oldstyle_file(cfg_filename)
+    if "site_file" in cfg_struct:
+        raise ValueError("site runs can't be tiled")
+    n_columns, n_rows = cfg_struct["grid_shape"]
+    tile_rows = tile_rows_for_budget(cfg_filename, memory_bytes)
+
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    outputs = {}
+    paths = {}
+
+    with tempfile.TemporaryDirectory() as cfg_directory:
+        cfg_files = write_tiled_config_files(
+            cfg_filename, n_columns, tile_rows, cfg_directory
+        )
+        for row, cfg_file in zip(range(0, n_rows, tile_rows), cfg_files):
+            result = run_member(cfg_file, until=until)
+            for name, values in result["values"].items():
+                if name not in outputs:
+                    paths[name] = output_directory / f"{name}.npy"
+                    outputs[name] = np.lib.format.open_memmap(
+                        paths[name],
+                        mode="w+",
+                        dtype=np.float32,
+                        shape=(n_rows, n_columns),
+                    )
+                outputs[name][row : row + values.shape[0]] = values
+                outputs[name].flush()
+
+    # Unmapping the arrays closes the files
+    outputs.clear()
+    return paths
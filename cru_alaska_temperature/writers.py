@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Write the model's output grids at every timestep
+
+Outputs are copied into a preallocated buffer of several timesteps and
+written out a batch at a time, either to a netCDF4 file (one chunk per
+batch) or to a directory of .npy chunk files.  Files are kept open from the
+first timestep until the writer is closed.
+"""
+import abc
+import json
+import pathlib
+
+import numpy as np
+
+from .readers import netcdf_lock, open_netcdf
+
+
+def open_output_writer(filename, names, grid_shape, flush_steps=12, time_units=""):
+    """Open a writer for the output grids of a run
+
+    Parameters
+    ----------
+    filename : str or Path
+        A netcdf file (.nc), or a directory to write chunk files into.
+    names : sequence of str
+        Name of each output grid.
+    grid_shape : tuple of int
+        Shape of each output grid.
+    flush_steps : int, optional
+        Number of timesteps buffered before they are written.
+    time_units : str, optional
+        Units of the model time.
+
+    Returns
+    -------
+    NetcdfOutputWriter or DirectoryOutputWriter
+    """
+    if pathlib.Path(filename).suffix == ".nc":
+        writer_class = NetcdfOutputWriter
+    else:
+        writer_class = DirectoryOutputWriter
+    return writer_class(
+        filename, names, grid_shape, flush_steps=flush_steps, time_units=time_units
+    )
+
+
+class OutputWriter(abc.ABC):
+    """Buffer the output grids of consecutive timesteps
+
+    Subclasses write a batch of buffered timesteps with _write().
+    """
+
+    def __init__(self, names, grid_shape, flush_steps=12):
+        if flush_steps < 1:
+            raise ValueError(f"flush_steps must be at least 1 ({flush_steps})")
+        self.names = tuple(names)
+        self.grid_shape = tuple(grid_shape)
+        self.flush_steps = flush_steps
+        self.n_written = 0
+
+        self._times = np.empty(flush_steps, dtype=np.float64)
+        self._buffer = np.empty(
+            (flush_steps, len(self.names)) + self.grid_shape, dtype=np.float32
+        )
+        self._n_buffered = 0
+
+    def append(self, time, grids):
+        """Add the output grids of one timestep
+
+        Parameters
+        ----------
+        time : float
+            The model time.
+        grids : ndarray
+            The output grids, one row per name.
+        """
+        self._times[self._n_buffered] = time
+        self._buffer[self._n_buffered] = grids
+        self._n_buffered += 1
+        if self._n_buffered == self.flush_steps:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered timesteps"""
+        if self._n_buffered > 0:
+            n = self._n_buffered
+            self._write(self._times[:n], self._buffer[:n])
+            self.n_written += self._n_buffered
+            self._n_buffered = 0
+
+    def close(self):
+        """Write the buffered timesteps and close the output"""
+        self.flush()
+
+    @abc.abstractmethod
+    def _write(self, times, grids):
+        """Write a batch of timesteps after those already written
+
+        Parameters
+        ----------
+        times : ndarray
+            The model time of each timestep.
+        grids : ndarray
+            The output grids of each timestep, one row per name.
+        """
+
+
+class NetcdfOutputWriter(OutputWriter):
+    """Append output grids to a netCDF4 file
+
+    The file has an unlimited time dimension and one variable per output
+    grid, chunked by flush_steps timesteps.
+    """
+
+    def __init__(self, filename, names, grid_shape, flush_steps=12, time_units=""):
+        super().__init__(names, grid_shape, flush_steps=flush_steps)
+        dimensions = ("y", "x") if len(self.grid_shape) == 2 else ("site",)
+        with netcdf_lock:
+            self._nc_file = open_netcdf(filename, "w", format="NETCDF4")
+            self._nc_file.createDimension("time", None)
+            for name, size in zip(dimensions, self.grid_shape):
+                self._nc_file.createDimension(name, size)
+            time = self._nc_file.createVariable("time", "f8", ("time",))
+            time.units = time_units
+            for name in self.names:
+                self._nc_file.createVariable(
+                    name,
+                    "f4",
+                    ("time",) + dimensions,
+                    zlib=True,
+                    chunksizes=(flush_steps,) + self.grid_shape,
+                )
+
+    def _write(self, times, grids):
+        t0, t1 = self.n_written, self.n_written + len(times)
+        with netcdf_lock:
+            self._nc_file.variables["time"][t0:t1] = times
+            for row, name in enumerate(self.names):
+                self._nc_file.variables[name][t0:t1] = grids[:, row]
+            self._nc_file.sync()
+
+    def close(self):
+        """Write the buffered timesteps and close the file"""
+        if self._nc_file is not None:
+            self.flush()
+            with netcdf_lock:
+                self._nc_file.close()
+            self._nc_file = None
+
+
+class DirectoryOutputWriter(OutputWriter):
+    """Write output grids into a directory of .npy chunk files
+
+    Each flush writes <name>/<first timestep>.npy for every output grid and
+    time/<first timestep>.npy.  An index.json describes the store.
+    """
+
+    def __init__(self, directory, names, grid_shape, flush_steps=12, time_units=""):
+        super().__init__(names, grid_shape, flush_steps=flush_steps)
+        self.directory = pathlib.Path(directory)
+        for name in ("time",) + self.names:
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+        self._index = {
+            "names": list(self.names),
+            "grid_shape": list(self.grid_shape),
+            "dtype": "float32",
+            "time_units": time_units,
+            "chunks": [],
+        }
+        self._write_index()
+
+    def _write(self, times, grids):
+        chunk = f"{self.n_written:08d}.npy"
+        np.save(self.directory / "time" / chunk, times)
+        for row, name in enumerate(self.names):
+            np.save(self.directory / name / chunk, grids[:, row])
+        self._index["chunks"].append(chunk)
+        self._write_index()
+
+    def _write_index(self):
+        (self.directory / "index.json").write_text(json.dumps(self._index, indent=2))
+
+
+def read_output_directory(directory, name):
+    """Read the values of one output grid from a directory of chunk files
+
+    Returns
+    -------
+    tuple of ndarray
+        The model times and the (time, ...) values.
+    """
+    directory = pathlib.Path(directory)
+    index = json.loads((directory / "index.json").read_text())
+    times = [np.load(directory / "time" / chunk) for chunk in index["chunks"]]
+    values = [np.load(directory / name / chunk) for chunk in index["chunks"]]
+    if not values:
+        return np.empty(0), np.empty((0,) + tuple(index["grid_shape"]), np.float32)
+    return np.concatenate(times), np.concatenate(values)
@@ -39,4 +39,9 @@ setup(
     packages=find_packages(),
     package_data={"": ["examples/*", "data/*"]},
     include_package_data=True,
+    entry_points={
+        "console_scripts": [
+            "cru-alaska-repack = cru_alaska_temperature.repack:main",
+        ],
+    },
 )
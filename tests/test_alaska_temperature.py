@@ -1,17 +1,28 @@
 """tests of the AlaskaTemperature component of permamodel"""
 
+import collections
 import datetime
+import os
 import pathlib
 
 import numpy as np
 import pkg_resources
 import pytest
 from dateutil.relativedelta import relativedelta
+from netCDF4 import Dataset
 
 from cru_alaska_temperature.utils import (
     write_gridfile, generate_default_temperature_run_cfg_file
 )
-from cru_alaska_temperature import AlaskaTemperature
+from cru_alaska_temperature import AlaskaTemperature, alaska_temperature, config
+from cru_alaska_temperature.alaska_temperature import read_site_file
+from cru_alaska_temperature.ensemble import set_oldstyle_config_values
+from cru_alaska_temperature.multifile import open_temperature_dataset
+from cru_alaska_temperature.readers import ReadPlan, detect_layout
+from cru_alaska_temperature.repack import repack
+from cru_alaska_temperature.spatial import GridLocator, unit_vectors
+from cru_alaska_temperature.store import shared_store
+from cru_alaska_temperature.writers import OutputWriter, read_output_directory
 
 
 data_directory = pathlib.Path(pkg_resources.resource_filename(
@@ -194,3 +205,765 @@ def test_jan_jul_arrays():
 
     assert ct.T_air_prior_jan[0, 0] == pytest.approx(expected_jan_val)
     assert ct.T_air_prior_jul[0, 0] == pytest.approx(expected_jul_val)
+
+
+def test_streaming_reads_match_eager_reads():
+    """ Test that streaming mode yields the same values as reading all data """
+    eager = AlaskaTemperature()
+    eager.initialize_from_config_file()
+    streaming = AlaskaTemperature()
+    streaming.initialize_from_config_file(
+        examples_directory / "streaming_temperature.cfg"
+    )
+    assert not isinstance(streaming._temperature, np.ndarray)
+    assert streaming._cru_temperature_ncfile is not None
+
+    for _ in range(3):
+        np.testing.assert_array_equal(streaming.T_air, eager.T_air)
+        np.testing.assert_array_equal(
+            streaming.T_air_prior_year, eager.T_air_prior_year
+        )
+        eager.update()
+        streaming.update()
+
+    streaming.finalize()
+    assert streaming._cru_temperature_ncfile is None
+
+
+def test_climate_outputs_are_opt_in(tmpdir):
+    """ Test that runs without climate outputs only read the months needed """
+    cfg_file = pathlib.Path(tmpdir) / "streaming.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "streaming_temperature.cfg").read_text(),
+            {"profile": "yes"},
+        )
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    assert "T_air_climatology" not in ct._output_grid_names
+    assert ct.T_air_climatology is None and ct.FDD_prior_year is None
+    assert ct._climatology is None and ct._prior_year_fdd is None
+
+    profile = ct.get_profile()
+    assert "climatology" not in profile
+    block_bytes = (12 + ct._read_ahead_months) * ct.T_air.nbytes
+    assert profile["streaming_netcdf_read"]["bytes_read"] < 2 * block_bytes
+    ct.finalize()
+
+
+def test_streaming_reader_holds_bounded_block():
+    """ Test that the streaming reader only keeps one block of months """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "streaming_temperature.cfg")
+    reader = ct._temperature
+    assert reader.shape[1:] == ct.T_air.shape
+
+    reader[100]
+    assert len(reader._block) == 12 + ct._read_ahead_months
+    with pytest.raises(IndexError):
+        reader[reader.shape[0]]
+    ct.finalize()
+
+
+def test_read_plan_matches_strided_reads():
+    """ Test that chunk-aligned reads return the strided window """
+    nc_filename = data_directory / "cru_alaska_lowres_temperature.nc"
+    with Dataset(nc_filename) as nc_file:
+        temp = nc_file.variables["temp"]
+        window = (slice(3, 40, 3), slice(5, 61, 2))
+        plan = ReadPlan(temp, window, months_per_read=5)
+        assert plan.months_per_read % plan.chunk_shape[0] == 0
+        assert temp.get_var_chunk_cache()[0] >= plan.bytes_decompressed(
+            0, plan.months_per_read
+        )
+
+        values = plan.read(10, 30)
+        np.testing.assert_array_equal(values, temp[(slice(10, 30),) + window])
+        assert values.dtype == np.float32
+        assert plan.bytes_used(10, 30) == values.nbytes
+        assert plan.bytes_decompressed(10, 30) >= values.nbytes
+        plan.close()
+
+
+@pytest.mark.parametrize("layout", ["map", "timeseries"])
+def test_repack_rechunks_for_layout(tmpdir, layout):
+    """ Test that repacked files hold the same data in the new layout """
+    nc_filename = data_directory / "cru_alaska_lowres_temperature.nc"
+    repacked = pathlib.Path(tmpdir) / f"{layout}.nc"
+    chunks = repack(nc_filename, repacked, layout, complevel=1)
+
+    with Dataset(nc_filename) as original, Dataset(repacked) as nc_file:
+        assert detect_layout(original) == "map"
+        assert detect_layout(nc_file) == layout
+        temp = nc_file.variables["temp"]
+        assert tuple(temp.chunking()) == chunks
+        if layout == "timeseries":
+            assert chunks[0] == temp.shape[0]
+        window = (slice(None), slice(10, 20), slice(30, 50))
+        np.testing.assert_array_equal(temp[window], original["temp"][window])
+        np.testing.assert_array_equal(nc_file["lat"][:], original["lat"][:])
+        assert nc_file["time"][:].tolist() == original["time"][:].tolist()
+
+
+def test_prefetching_reader_matches_eager_reads():
+    """ Test that prefetched blocks hold the same values as eager reads """
+    eager = AlaskaTemperature()
+    eager.initialize_from_config_file()
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "prefetch_temperature.cfg")
+    reader = ct._temperature
+    assert reader._executor is not None
+
+    for _ in range(8):
+        np.testing.assert_array_equal(ct.T_air, eager.T_air)
+        np.testing.assert_array_equal(ct.T_air_prior_year, eager.T_air_prior_year)
+        ct.update()
+        eager.update()
+
+    # Stepping forward uses the prefetched block; jumping back reads again
+    for idx in [500, 520, 530, 545, 100, 101, 1307]:
+        block_start = reader._pending_start
+        np.testing.assert_array_equal(reader[idx], eager._temperature[idx])
+        if block_start is not None and block_start <= idx < block_start + 24:
+            assert reader._block_start == block_start
+    ct.finalize()
+    assert reader._executor is None
+
+
+@pytest.mark.parametrize("storage,atol", [("float16", 2e-2), ("int16", 2e-3)])
+def test_reduced_precision_storage(tmpdir, storage, atol):
+    """ Test that a packed record decodes close to the float32 record """
+    eager = AlaskaTemperature()
+    eager.initialize_from_config_file()
+    cfg_file = pathlib.Path(tmpdir) / "packed.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "packed_temperature.cfg").read_text(),
+            {"temperature_storage": storage},
+        )
+    )
+    packed = AlaskaTemperature()
+    packed.initialize_from_config_file(cfg_file)
+    assert packed._temperature.nbytes == eager._temperature.nbytes // 2
+
+    for _ in range(3):
+        for name in packed._output_grid_names:
+            # Degree days add up a year of daily errors
+            tolerance = atol * 366 if name.endswith("DD_prior_year") else atol
+            np.testing.assert_allclose(
+                getattr(packed, name), getattr(eager, name), atol=tolerance
+            )
+            assert getattr(packed, name).dtype == np.float32
+        eager.update()
+        packed.update()
+
+
+def test_prior_year_is_running_mean_of_prior_months():
+    """ Test that the ring buffer mean matches a full 12-month average """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file()
+
+    # Shifting by a single month adjusts the running sum incrementally
+    for months in (1, 1, 5, 12, 1):
+        ct._current_date += relativedelta(months=months)
+        ct.update_temperature_values()
+        idx = ct.get_time_index(ct._current_date.month, ct._current_date.year)
+        expected = ct._temperature[idx - 11 : idx + 1]
+        np.testing.assert_array_equal(ct.T_air_prior_months, expected)
+        np.testing.assert_array_equal(ct.T_air, ct._temperature[idx])
+        np.testing.assert_allclose(
+            ct.T_air_prior_year, expected.mean(axis=0, dtype=np.float64), rtol=1e-5
+        )
+
+
+def test_climatology_anomaly_and_degree_days():
+    """ Test the fused outputs against separate passes over the record """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "climate_temperature.cfg")
+    assert ct._climatology_years == (1961, 1990)
+
+    base = ct._temperature[
+        ct.get_time_index(1, 1961) : ct.get_time_index(12, 1990) + 1
+    ].reshape((30, 12) + ct.T_air.shape)
+    climatology = base.mean(axis=0, dtype=np.float64)
+
+    # Monthly steps load one new month into the ring at a time
+    for _ in range(14):
+        idx = ct._time_index
+        month = ct.date_from_time_index(idx).month
+        np.testing.assert_allclose(
+            ct.T_air_climatology, climatology[month - 1], rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            ct.T_air_anomaly, ct.T_air - climatology[month - 1], atol=1e-4
+        )
+
+        prior = ct._temperature[idx - 11 : idx + 1]
+        days = np.array(
+            [
+                (ct.date_from_time_index(n + 1) - ct.date_from_time_index(n)).days
+                for n in range(idx - 11, idx + 1)
+            ]
+        ).reshape((12, 1, 1))
+        np.testing.assert_allclose(
+            ct.FDD_prior_year, (np.maximum(-prior, 0) * days).sum(axis=0), rtol=1e-4
+        )
+        np.testing.assert_allclose(
+            ct.TDD_prior_year, (np.maximum(prior, 0) * days).sum(axis=0), rtol=1e-4
+        )
+        ct.update()
+
+
+@pytest.mark.parametrize("climate_outputs", ["no", "yes"])
+def test_precomputed_outputs_match_stepped_outputs(tmpdir, climate_outputs):
+    """ Test that precomputing all timesteps yields the stepped values """
+    cfg_files = []
+    for example in ("default_temperature.cfg", "precompute_temperature.cfg"):
+        cfg_files.append(pathlib.Path(tmpdir) / example)
+        cfg_files[-1].write_text(
+            set_oldstyle_config_values(
+                (examples_directory / example).read_text(),
+                {"climate_outputs": climate_outputs},
+            )
+        )
+    stepped = AlaskaTemperature()
+    stepped.initialize_from_config_file(cfg_files[0])
+    precomputed = AlaskaTemperature()
+    precomputed.initialize_from_config_file(cfg_files[1])
+    assert sorted(precomputed._series) == sorted(precomputed._output_grid_names)
+    n_steps = precomputed._last_timestep - precomputed._first_timestep + 1
+    assert precomputed._series["T_air"].shape == (n_steps,) + stepped.T_air.shape
+
+    for _ in range(n_steps):
+        for name in ("T_air", "T_air_prior_jan", "T_air_prior_jul"):
+            np.testing.assert_array_equal(
+                getattr(precomputed, name), getattr(stepped, name)
+            )
+        for name in precomputed._output_grid_names[3:]:
+            np.testing.assert_allclose(
+                getattr(precomputed, name), getattr(stepped, name), rtol=1e-5
+            )
+        np.testing.assert_array_equal(
+            precomputed.T_air_prior_months, stepped.T_air_prior_months
+        )
+        stepped.update()
+        precomputed.update()
+
+
+def test_shared_store_shares_one_read_only_record(tmpdir):
+    """ Test that instances with the same domain share temperature data """
+    cfg_text = (examples_directory / "default_temperature.cfg").read_text()
+    cfg_file = tmpdir / "shared_temperature.cfg"
+    cfg_file.write(
+        cfg_text + "shared_temperature_store | yes | string | share data\n"
+    )
+
+    first = AlaskaTemperature()
+    first.initialize_from_config_file(str(cfg_file))
+    second = AlaskaTemperature()
+    second.initialize_from_config_file(str(cfg_file))
+
+    assert np.shares_memory(first._temperature, second._temperature)
+    assert not first._temperature.flags.writeable
+    assert shared_store.refcount(first._store_key) == 2
+
+    key = first._store_key
+    first.finalize()
+    second.finalize()
+    assert shared_store.refcount(key) == 0
+    shared_store.clear()
+    assert key not in shared_store
+
+
+def test_cache_directory_memory_maps_decoded_data(tmpdir, monkeypatch):
+    """ Test that decoded data are cached and reopened memory-mapped """
+    cfg_text = (examples_directory / "default_temperature.cfg").read_text()
+    cfg_file = tmpdir / "cached_temperature.cfg"
+    cfg_file.write(cfg_text + "cache_directory | cache | string | npy cache\n")
+    # The cache is next to the config file, wherever the model is run from
+    monkeypatch.chdir(tmpdir.mkdir("elsewhere"))
+
+    first = AlaskaTemperature()
+    first.initialize_from_config_file(str(cfg_file))
+    assert len((tmpdir / "cache").listdir()) == 3
+    assert not isinstance(first._temperature, np.memmap)
+
+    second = AlaskaTemperature()
+    second.initialize_from_config_file(str(cfg_file))
+    assert isinstance(second._temperature, np.memmap)
+    np.testing.assert_array_equal(second._temperature, first._temperature)
+    np.testing.assert_array_equal(second._latitude, first._latitude)
+    np.testing.assert_array_equal(second.T_air_prior_year, first.T_air_prior_year)
+
+
+def test_site_mode_reads_nearest_cells():
+    """ Test that site mode provides temperatures at each listed site """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "site_temperature.cfg")
+    n_sites = len(ct._site_j)
+    assert n_sites == 4
+    assert ct._temperature.shape == (ct._nc_tdim, n_sites)
+    assert ct.T_air.shape == ct.T_air_prior_year.shape == (n_sites,)
+
+    with Dataset(ct._cru_temperature_nc_filename) as nc_file:
+        full_temperature = np.asarray(nc_file.variables["temp"][:])
+    np.testing.assert_array_equal(
+        ct._temperature, full_temperature[:, ct._site_j, ct._site_i]
+    )
+
+    # Each site is mapped to the cell with the closest coordinates
+    site_lat, site_lon = read_site_file(examples_directory / "sites.txt")
+    np.testing.assert_allclose(ct._latitude, site_lat, atol=0.5)
+    np.testing.assert_allclose(ct._longitude, site_lon, atol=0.5)
+
+
+def test_site_mode_reads_coordinates_once(monkeypatch):
+    """ Test that site mode reads the latitude and longitude grids once """
+    reads = collections.Counter()
+
+    class CountingVariable:
+        def __init__(self, name, variable):
+            self._name, self._variable = name, variable
+
+        def __getitem__(self, key):
+            reads[self._name] += 1
+            return self._variable[key]
+
+    class CountingDataset:
+        def __init__(self, nc_file):
+            self._nc_file = nc_file
+            self.variables = dict(nc_file.variables)
+            for name in ("lat", "lon"):
+                self.variables[name] = CountingVariable(name, self.variables[name])
+
+        def __getattr__(self, name):
+            return getattr(self._nc_file, name)
+
+    monkeypatch.setattr(
+        alaska_temperature,
+        "open_temperature_dataset",
+        lambda *args, **kwds: CountingDataset(open_temperature_dataset(*args, **kwds)),
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "site_temperature.cfg")
+    assert reads == {"lat": 1, "lon": 1}
+
+
+def test_index_conversions_accept_arrays():
+    """ Test that model and netcdf indexes convert as arrays """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file()
+
+    i = np.arange(ct._grid_shape[0])
+    i_nc = ct.i_nc_from_i(i, check_bounds=True)
+    np.testing.assert_array_equal(i_nc, ct._nc_i0 + i)
+    np.testing.assert_array_equal(ct.i_nc_from_i(i_nc, inverse=True), i)
+
+    j = [0, 5, ct._grid_shape[1] - 1]
+    np.testing.assert_array_equal(
+        ct.j_nc_from_j(j, check_bounds=True), np.add(ct._nc_j0, j)
+    )
+    with pytest.raises(ValueError):
+        ct.j_nc_from_j([0, ct._grid_shape[1]], check_bounds=True)
+
+
+def test_cells_from_lat_lon_finds_model_cells():
+    """ Test that coordinates of model cells map back to those cells """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file()
+
+    j, i = ct.cells_from_lat_lon(ct._latitude, ct._longitude)
+    expected_j, expected_i = np.indices(ct._latitude.shape)
+    np.testing.assert_array_equal(j, expected_j.reshape(-1))
+    np.testing.assert_array_equal(i, expected_i.reshape(-1))
+
+    # Points away from the grid still map to their nearest cell
+    j, i = ct.cells_from_lat_lon([0.0], [0.0])
+    assert 0 <= j[0] < ct._latitude.shape[0] and 0 <= i[0] < ct._latitude.shape[1]
+
+
+@pytest.mark.parametrize(
+    "example, first, second",
+    [
+        ("default_temperature.cfg", {}, {"i_ul": 0}),
+        ("default_temperature.cfg", {}, {"grid_columns": 7, "grid_rows": 3}),
+        ("default_temperature.cfg", {"precompute_outputs": "yes"}, {"i_ul": 0}),
+        ("daily_temperature.cfg", {}, {"i_ul": 0}),
+    ],
+    ids=["moved", "resized", "precomputed", "daily"],
+)
+def test_initialize_again_forgets_the_last_run(tmpdir, example, first, second):
+    """ Test that a second initialization matches a fresh instance """
+    cfg_text = (examples_directory / example).read_text()
+    cfg_files = []
+    for n, values in enumerate((first, second)):
+        cfg_files.append(pathlib.Path(tmpdir) / f"run{n}.cfg")
+        cfg_files[-1].write_text(set_oldstyle_config_values(cfg_text, values))
+    fresh = AlaskaTemperature()
+    fresh.initialize_from_config_file(cfg_files[1])
+
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_files[0])
+    ct.update()
+    ct.cells_from_lat_lon([61.0], [-150.0])
+    ct.initialize_from_config_file(cfg_files[1])
+    for _ in range(2):
+        for name in ct._output_grid_names:
+            np.testing.assert_array_equal(getattr(ct, name), getattr(fresh, name))
+        np.testing.assert_array_equal(
+            ct.cells_from_lat_lon([61.0], [-150.0]),
+            fresh.cells_from_lat_lon([61.0], [-150.0]),
+        )
+        ct.update()
+        fresh.update()
+
+
+def test_grid_locator_on_a_high_latitude_grid():
+    """ Test that cells found near the pole are the nearest ones """
+    lon, lat = np.meshgrid(np.arange(-179.75, 180.0, 2.5), np.arange(45.25, 90.0, 0.5))
+    locator = GridLocator(lat, lon)
+
+    rng = np.random.default_rng(0)
+    points_lat = np.degrees(np.arcsin(rng.uniform(np.sin(np.radians(40.0)), 1.0, 2000)))
+    points_lon = rng.uniform(-180.0, 180.0, 2000)
+    j, i = locator.nearest(points_lat, points_lon, chunk_size=500)
+
+    # Ties between equally near cells may pick either, so compare distances
+    points = unit_vectors(points_lat, points_lon)
+    cells = unit_vectors(lat, lon).reshape((-1, 3))
+    found = np.einsum("pk,pk->p", points, unit_vectors(lat[j, i], lon[j, i]))
+    np.testing.assert_allclose(found, (points @ cells.T).max(axis=1), atol=1e-12)
+
+
+def test_monthly_timesteps_advance_one_month():
+    """ Test that a monthly run steps through consecutive months """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "monthly_temperature.cfg")
+    assert ct._time_units == "months"
+    assert ct._current_date == datetime.date(1902, 1, 15)
+    assert ct.get_end_timestep() == 9 * 12 - 1
+
+    idx = ct.get_time_index(1, 1902)
+    for step in range(1, 15):
+        ct.update()
+        assert ct.get_current_timestep() == step
+        window = ct._temperature[idx + step - 11 : idx + step + 1]
+        np.testing.assert_array_equal(ct.T_air, window[-1])
+        np.testing.assert_allclose(
+            ct.T_air_prior_year, window.mean(axis=0, dtype=np.float64), rtol=1e-5
+        )
+        # The January and July grids are those of the most recent ones
+        last_jan = idx + step - (idx + step) % 12
+        np.testing.assert_array_equal(ct.T_air_prior_jan, ct._temperature[last_jan])
+
+
+def test_prior_year_recovers_after_first_year_of_record(tmpdir):
+    """ Test that months before the record leave the running sums """
+    cfg_file = pathlib.Path(tmpdir) / "first_year.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "climate_temperature.cfg").read_text(),
+            {"model_start_year": 1901},
+        )
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    assert np.isnan(ct.T_air_prior_year).all()
+
+    for _ in range(30):
+        ct.update()
+    idx = ct._time_index
+    window = ct._temperature[idx - 11 : idx + 1]
+    np.testing.assert_allclose(
+        ct.T_air_prior_year, window.mean(axis=0, dtype=np.float64), rtol=1e-5
+    )
+
+    # Degree days are running sums too
+    days = np.array(
+        [
+            (ct.date_from_time_index(n + 1) - ct.date_from_time_index(n)).days
+            for n in range(idx - 11, idx + 1)
+        ]
+    ).reshape((12, 1, 1))
+    np.testing.assert_allclose(
+        ct.FDD_prior_year, (np.maximum(-window, 0) * days).sum(axis=0), rtol=1e-4
+    )
+    np.testing.assert_allclose(
+        ct.TDD_prior_year, (np.maximum(window, 0) * days).sum(axis=0), rtol=1e-4
+    )
+
+
+def split_netcdf_record(nc_filename, directory, months_per_file=60):
+    """Write the record of a netcdf file into files of a few years each"""
+    filenames = []
+    with Dataset(nc_filename) as nc_file:
+        nt = len(nc_file.variables["time"])
+        for n, t0 in enumerate(range(0, nt, months_per_file)):
+            filenames.append(pathlib.Path(directory) / f"part_{n:02d}.nc")
+            with Dataset(filenames[-1], "w") as part:
+                for name, dimension in nc_file.dimensions.items():
+                    size = len(dimension)
+                    if name == "time":
+                        size = min(months_per_file, nt - t0)
+                    part.createDimension(name, size)
+                for name, variable in nc_file.variables.items():
+                    copy = part.createVariable(
+                        name, variable.dtype, variable.dimensions, zlib=True
+                    )
+                    copy.setncatts(
+                        {a: variable.getncattr(a) for a in variable.ncattrs()}
+                    )
+                    if variable.dimensions[0] == "time":
+                        copy[:] = variable[t0 : t0 + months_per_file]
+                    else:
+                        copy[:] = variable[:]
+    return filenames
+
+
+def test_config_file_is_parsed_once(tmpdir, monkeypatch):
+    """ Test that a config file is reparsed only when it changes """
+    cfg_file = pathlib.Path(tmpdir) / "cached.cfg"
+    cfg_file.write_text(
+        (examples_directory / "default_temperature.cfg").read_text()
+    )
+    os.utime(cfg_file, (1e9, 1e9))
+
+    cfg_struct = config.load_config(cfg_file)
+    assert cfg_struct["grid_shape"] == (40, 20)
+    assert cfg_struct["grids"] == {"temperature": np.dtype("float64")}
+
+    def fail(path):
+        raise AssertionError(f"{path} parsed again")
+
+    monkeypatch.setattr(config, "_parse_oldstyle_options", fail)
+    cfg_struct["grid_shape"] = (1, 1)
+    assert config.load_config(cfg_file)["grid_shape"] == (40, 20)
+
+    os.utime(cfg_file, (2e9, 2e9))
+    with pytest.raises(AssertionError):
+        config.load_config(cfg_file)
+
+
+def test_config_values_are_typed_and_validated(tmpdir):
+    """ Test that old-style and YAML configs parse to the same values """
+    oldstyle = config.load_config(
+        examples_directory / "default_temperature_oldstyle.cfg"
+    )
+    yaml_style = config.load_config(
+        examples_directory / "default_temperature_yaml.cfg", style="yaml"
+    )
+    for name in ("grid_shape", "grids", "i_ul", "timestep", "model_start_date"):
+        assert oldstyle[name] == yaml_style[name]
+
+    cfg_text = (examples_directory / "default_temperature.cfg").read_text()
+    cfg_file = pathlib.Path(tmpdir) / "skip.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            cfg_text, {"i_skip": 2, "j_skip": 3, "profile": "yes"}
+        )
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    assert (ct._nc_iskip, ct._nc_jskip) == (2, 3)
+    assert ct._profiler.enabled is True
+    assert ct.temperature_grid.shape == (40, 20)
+
+    cfg_file.write_text(set_oldstyle_config_values(cfg_text, {"i_ul": "left"}))
+    with pytest.raises(ValueError, match="line 20: bad value for i_ul"):
+        config.load_config(cfg_file)
+
+
+def test_record_split_across_files(tmpdir):
+    """ Test that a glob or manifest of files reads as a single record """
+    nc_filename = data_directory / "cru_alaska_lowres_temperature.nc"
+    filenames = split_netcdf_record(nc_filename, tmpdir)
+    manifest = pathlib.Path(tmpdir) / "manifest.txt"
+    manifest.write_text("".join(f"{f.name}\n" for f in reversed(filenames)))
+
+    cfg_text = (examples_directory / "monthly_temperature.cfg").read_text()
+    for source in ("part_*.nc", "manifest.txt"):
+        cfg_file = pathlib.Path(tmpdir) / "split.cfg"
+        cfg_file.write_text(
+            set_oldstyle_config_values(
+                cfg_text,
+                {
+                    "temperature_file": source,
+                    "temperature_read_mode": "streaming",
+                    "max_open_files": 2,
+                },
+            )
+        )
+        single = AlaskaTemperature()
+        single.initialize_from_config_file(
+            examples_directory / "monthly_temperature.cfg"
+        )
+        split = AlaskaTemperature()
+        split.initialize_from_config_file(cfg_file)
+        assert len(split._cru_temperature_ncfile.filenames) == len(filenames)
+        assert split._first_valid_date == single._first_valid_date
+        assert split._last_valid_date == single._last_valid_date
+
+        # 1902 to 1910 crosses from the first file into the second
+        for _ in range(9 * 12 - 1):
+            assert len(split._cru_temperature_ncfile.open_files) <= 2
+            np.testing.assert_array_equal(split.T_air, single.T_air)
+            np.testing.assert_array_equal(
+                split.T_air_prior_year, single.T_air_prior_year
+            )
+            split.update()
+            single.update()
+        assert 1 in split._cru_temperature_ncfile.open_files
+        split.finalize()
+        single.finalize()
+
+
+def test_record_split_across_files_must_be_consecutive(tmpdir):
+    """ Test that missing or overlapping files of a record are rejected """
+    nc_filename = data_directory / "cru_alaska_lowres_temperature.nc"
+    filenames = split_netcdf_record(nc_filename, tmpdir)
+    filenames[2].unlink()
+    cfg_file = pathlib.Path(tmpdir) / "split.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "monthly_temperature.cfg").read_text(),
+            {"temperature_file": "part_*.nc"},
+        )
+    )
+    ct = AlaskaTemperature()
+    with pytest.raises(ValueError, match="1911-01 to 1915-12 are missing"):
+        ct.initialize_from_config_file(cfg_file)
+
+    # Files must not hold the same months
+    other_directory = pathlib.Path(tmpdir) / "other"
+    other_directory.mkdir()
+    split_netcdf_record(nc_filename, other_directory, 48)[1].rename(filenames[2])
+    with pytest.raises(ValueError, match="part_02.nc starts at 1905-01"):
+        ct.initialize_from_config_file(cfg_file)
+
+
+@pytest.mark.parametrize("output_file", ["outputs.nc", "outputs"])
+def test_outputs_written_every_step(tmpdir, output_file):
+    """ Test that the output file holds the output grids of every step """
+    cfg_file = pathlib.Path(tmpdir) / "output.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "default_temperature.cfg").read_text(),
+            {"output_file": output_file, "output_flush_steps": 3},
+        )
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    expected = [ct.T_air_prior_year.copy()]
+    for _ in range(4):
+        ct.update()
+        expected.append(ct.T_air_prior_year.copy())
+    # Only whole batches of steps have been written so far
+    assert ct._output_writer.n_written == 3
+    ct.finalize()
+
+    output_path = pathlib.Path(tmpdir) / output_file
+    if output_file.endswith(".nc"):
+        with Dataset(output_path) as nc_file:
+            times = nc_file.variables["time"][:]
+            values = nc_file.variables["T_air_prior_year"][:]
+    else:
+        times, values = read_output_directory(output_path, "T_air_prior_year")
+    assert list(times) == [0, 1, 2, 3, 4]
+    np.testing.assert_array_equal(values, expected)
+
+
+def test_output_example_writes_next_to_its_config(tmpdir):
+    """ Test that a copy of the output example writes into its own folder """
+    cfg_file = pathlib.Path(tmpdir) / "output_temperature.cfg"
+    cfg_file.write_text((examples_directory / "output_temperature.cfg").read_text())
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    ct.finalize()
+    assert (pathlib.Path(tmpdir) / "output_temperature.nc").exists()
+    assert not (examples_directory / "output_temperature.nc").exists()
+
+    # Writers must say how batches are written
+    with pytest.raises(TypeError):
+        OutputWriter(ct._output_grid_names, ct.T_air.shape)
+
+
+def test_fractional_updates_write_each_step_once(tmpdir):
+    """ Test that updates that round to no steps write no outputs """
+    cfg_file = pathlib.Path(tmpdir) / "output.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            (examples_directory / "default_temperature.cfg").read_text(),
+            {"output_file": "outputs"},
+        )
+    )
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(cfg_file)
+    ct.update(frac=0.2)
+    ct.update(frac=0.2)
+    ct.update()
+    ct.update(frac=2)
+    ct.finalize()
+
+    times, _ = read_output_directory(pathlib.Path(tmpdir) / "outputs", "T_air")
+    assert list(times) == [0, 1, 3]
+
+
+def test_time_is_kept_as_netcdf_time_index():
+    """ Test that model dates and timesteps follow the netcdf time index """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file()
+    assert ct._time_index == ct.get_time_index(12, 1902)
+
+    ct.increment_date(3)
+    assert ct._time_index == ct.get_time_index(12, 1905)
+    assert ct._current_date == datetime.date(1905, 12, 15)
+    assert ct.get_current_timestep() == 3
+
+    ct._current_date = datetime.date(1908, 12, 15)
+    assert ct._time_index == ct.get_time_index(12, 1908)
+    assert ct.timestep_from_time_index(ct._time_index) == 6
+
+    with pytest.raises(ValueError):
+        ct.increment_date(0.5 / 12)
+
+
+def test_daily_timesteps_interpolate_monthly_means(tmpdir):
+    """ Test that daily temperatures pass through mid-month means """
+    ct = AlaskaTemperature()
+    ct.initialize_from_config_file(examples_directory / "daily_temperature.cfg")
+    assert ct._current_date == datetime.date(1902, 1, 1)
+
+    jan = ct.get_time_index(1, 1902)
+    ct.increment_date(15)
+    ct.update_temperature_values()
+    assert ct._current_date == datetime.date(1902, 1, 16)
+    np.testing.assert_allclose(ct.T_air, ct._temperature[jan], atol=1e-5)
+
+    # January 31 is 15 of the 29.5 days from mid-January to mid-February
+    ct.increment_date(15)
+    ct.update_temperature_values()
+    weight = 15 / 29.5
+    np.testing.assert_allclose(
+        ct.T_air,
+        (1 - weight) * ct._temperature[jan] + weight * ct._temperature[jan + 1],
+        atol=1e-4,
+    )
+    np.testing.assert_array_equal(ct.T_air_prior_jan, ct._temperature[jan])
+
+    # Mean-preserving interpolation keeps monthly averages closer to the means
+    cfg_text = (examples_directory / "daily_temperature.cfg").read_text()
+    cfg_file = tmpdir / "mean_preserving.cfg"
+    cfg_file.write(cfg_text.replace("| linear ", "| mean_preserving "))
+    errors = []
+    for cfg in (examples_directory / "daily_temperature.cfg", str(cfg_file)):
+        ct = AlaskaTemperature()
+        ct.initialize_from_config_file(cfg)
+        july = []
+        while ct._current_date < datetime.date(1902, 8, 1):
+            if ct._current_date.month == 7:
+                july.append(ct.T_air.copy())
+            ct.update()
+        july_mean = ct._temperature[ct.get_time_index(7, 1902)]
+        errors.append(np.abs(np.mean(july, axis=0) - july_mean).mean())
+    assert errors[1] < errors[0]
@@ -4,15 +4,18 @@ import datetime
 
 import pathlib
 
+import numpy as np
 import pkg_resources
+import pytest
 
 from cru_alaska_temperature import AlaskaTemperatureBMI
+from cru_alaska_temperature.ensemble import set_oldstyle_config_values
 
 
-default_config_filename = (
-    pathlib.Path(pkg_resources.resource_filename("cru_alaska_temperature", "examples"))
-    / "default_temperature.cfg"
+examples_directory = pathlib.Path(
+    pkg_resources.resource_filename("cru_alaska_temperature", "examples")
 )
+default_config_filename = examples_directory / "default_temperature.cfg"
 
 
 # ---------------------------------------------------
@@ -60,6 +63,15 @@ def test_get_output_var_names():
     #               'datetime__end')
     assert output_vars == output_list
 
+    # Climatology, anomaly and degree days are only output when asked for
+    ct.initialize(cfg_file=examples_directory / "climate_temperature.cfg")
+    assert ct.get_output_var_names() == output_list + (
+        "atmosphere_bottom_air__temperature_climatology",
+        "atmosphere_bottom_air__temperature_anomaly",
+        "atmosphere_bottom_air__freezing_degree_days",
+        "atmosphere_bottom_air__thawing_degree_days",
+    )
+
 
 def test_get_var_name():
     ct = AlaskaTemperatureBMI()
@@ -68,3 +80,127 @@ def test_get_var_name():
     assert this_var_name == "T_air"
     this_var_name = ct.get_var_name("atmosphere_bottom_air__temperature_mean_jul")
     assert this_var_name == "T_air_prior_jul"
+
+
+@pytest.mark.parametrize("climate_outputs", ["no", "yes"])
+def test_value_ref_stays_valid_across_updates(tmpdir, climate_outputs):
+    cfg_file = pathlib.Path(tmpdir) / "value_ref.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            default_config_filename.read_text(), {"climate_outputs": climate_outputs}
+        )
+    )
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(cfg_file=cfg_file)
+    refs = [ct.get_value_ref(name) for name in ct.get_output_var_names()]
+    before = [ref.copy() for ref in refs]
+
+    ct.update()
+    for name, ref, old in zip(ct.get_output_var_names(), refs, before):
+        assert ref is ct.get_value_ref(name)
+        assert ref is getattr(ct._model, ct.get_var_name(name))
+        if name != "atmosphere_bottom_air__temperature_climatology":
+            # Yearly steps keep to one calendar month, and its climatology
+            assert not np.array_equal(ref, old)
+
+        out = np.empty(ref.size, dtype=ref.dtype)
+        np.testing.assert_array_equal(ct.get_value(name, out), ref.reshape(-1))
+
+
+def test_get_values_fills_one_row_per_variable():
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(cfg_file=default_config_filename)
+    ct.update()
+    names = ct.get_output_var_names()[::-1]
+    n_nodes = ct.get_grid_size(ct.get_var_grid(names[0]))
+
+    out = np.empty((len(names), n_nodes), dtype=np.float32)
+    assert ct.get_values(names, out=out) is out
+    for row, name in zip(out, names):
+        np.testing.assert_array_equal(row, ct.get_value_ref(name).reshape(-1))
+
+    indices = np.array([0, 7, n_nodes - 1])
+    at_indices = ct.get_values_at_indices(names, indices)
+    assert at_indices.shape == (len(names), len(indices))
+    for row, name in zip(at_indices, names):
+        np.testing.assert_array_equal(row, ct.get_value_at_indices(name, indices))
+
+    out = np.empty((len(names), len(indices)), dtype=np.float32)
+    assert ct.get_values_at_indices(names, indices, out=out) is out
+    np.testing.assert_array_equal(out, at_indices)
+
+
+def test_site_mode_has_one_node_per_site():
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(cfg_file=default_config_filename.with_name("site_temperature.cfg"))
+    grid = ct.get_var_grid("atmosphere_bottom_air__temperature")
+    assert ct.get_grid_type(grid) == "points"
+    assert ct.get_grid_rank(grid) == 1
+    assert ct.get_grid_size(grid) == 4
+
+
+def test_update_until_in_months():
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(
+        cfg_file=default_config_filename.with_name("monthly_temperature.cfg")
+    )
+    assert ct.get_time_units() == "months"
+    ct.update_until(18)
+    assert ct.get_current_time() == 18
+    assert ct._model._current_date == datetime.date(1903, 7, 15)
+
+
+def test_update_frac_rounds_to_whole_timesteps():
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(cfg_file=default_config_filename)
+    ct.update_frac(1.0)
+    assert ct.get_current_time() == 1
+    ct.update_frac(0.2)
+    assert ct.get_current_time() == 1
+
+
+def test_profile_times_phases(tmpdir):
+    ct = AlaskaTemperatureBMI()
+    ct.initialize(cfg_file=default_config_filename)
+    assert ct.get_profile() == {}
+    ct.finalize()
+
+    for read_mode in ("eager", "streaming"):
+        cfg_file = pathlib.Path(tmpdir) / "profile.cfg"
+        cfg_file.write_text(
+            set_oldstyle_config_values(
+                default_config_filename.read_text(),
+                {"profile": "yes", "temperature_read_mode": read_mode},
+            )
+        )
+        ct = AlaskaTemperatureBMI()
+        ct.initialize(cfg_file=str(cfg_file))
+        ct.update()
+        ct.update()
+        name = "atmosphere_bottom_air__temperature"
+        ct.get_value(name, np.empty(ct.get_grid_size(ct.get_var_grid(name))))
+        profile = ct.get_profile()
+
+        for phase in (
+            "initialize_from_config_file",
+            "open_netcdf",
+            "read_nc_window",
+            "update",
+            "increment_date",
+            "update_temperature_values",
+            "prior_year_average",
+            "bmi.get_value",
+        ):
+            assert profile[phase]["calls"] > 0
+        assert profile["update"]["calls"] == 2
+        # Phases are not nested in themselves, so each call is counted once
+        assert (
+            profile["prior_year_average"]["calls"]
+            == profile["update_temperature_values"]["calls"]
+        )
+        assert profile["initialize_from_config_file"]["arrays_allocated"] == 1
+
+        netcdf_read = "netcdf_read" if read_mode == "eager" else "streaming_netcdf_read"
+        assert profile[netcdf_read]["bytes_read"] > 0
+        assert profile[netcdf_read]["seconds"] > 0
+        ct.finalize()
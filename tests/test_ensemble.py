@@ -0,0 +1,128 @@
+"""tests of running ensembles of AlaskaTemperatureBMI components"""
+
+import pathlib
+
+import numpy as np
+import pkg_resources
+import pytest
+from netCDF4 import Dataset
+
+from cru_alaska_temperature.ensemble import (
+    mosaic,
+    run_ensemble,
+    run_member,
+    set_oldstyle_config_values,
+    write_tiled_config_files,
+)
+from cru_alaska_temperature.tiling import run_tiled, tile_rows_for_budget
+
+
+default_config_filename = (
+    pathlib.Path(pkg_resources.resource_filename("cru_alaska_temperature", "examples"))
+    / "default_temperature.cfg"
+)
+
+
+def test_write_tiled_config_files(tmpdir):
+    cfg_files = write_tiled_config_files(default_config_filename, 15, 8, tmpdir)
+    # A 40 x 20 domain makes 3 x 3 tiles
+    assert len(cfg_files) == 9
+    assert "i_ul                | 80 |" in cfg_files[-1].read_text()
+    assert "grid_columns        | 10 |" in cfg_files[-1].read_text()
+    assert "grid_rows           | 4 |" in cfg_files[-1].read_text()
+
+
+def test_tiled_ensemble_matches_single_run(tmpdir):
+    whole = run_member(default_config_filename, until=3)
+
+    cfg_files = write_tiled_config_files(default_config_filename, 15, 8, tmpdir)
+    results = run_ensemble(cfg_files, until=3, max_workers=2)
+    assert [result["cfg_file"] for result in results] == [str(f) for f in cfg_files]
+    assert all(result["time"] == 3 for result in results)
+
+    for name, values in whole["values"].items():
+        np.testing.assert_array_equal(mosaic(results, name), values)
+
+
+def test_tiles_write_separate_output_files(tmpdir):
+    run_directory = pathlib.Path(tmpdir) / "run"
+    run_directory.mkdir()
+    cfg_file = run_directory / "output.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            default_config_filename.read_text(), {"output_file": "outputs.nc"}
+        )
+    )
+    cfg_files = write_tiled_config_files(
+        cfg_file, 15, 8, pathlib.Path(tmpdir) / "tiles"
+    )
+    results = run_ensemble(cfg_files, until=3, max_workers=2)
+
+    # Outputs are written next to the original config file, one per tile
+    output_files = sorted(run_directory.glob("outputs_*.nc"))
+    assert len(output_files) == len(cfg_files)
+    assert output_files[-1].name == "outputs_0016_0030.nc"
+    for result, output_file in zip(results, output_files):
+        with Dataset(output_file) as nc_file:
+            assert list(nc_file.variables["time"][:]) == [0, 1, 2, 3]
+            np.testing.assert_array_equal(
+                nc_file.variables["T_air_prior_year"][-1],
+                result["values"]["atmosphere_bottom_air__temperature_year"],
+            )
+
+    # Tiles run from a temporary directory still write next to the config
+    paths = run_tiled(cfg_file, 1200000, pathlib.Path(tmpdir) / "tiled", until=3)
+    assert paths
+    assert (run_directory / "outputs_0000_0000.nc").exists()
+
+
+def test_run_tiled_fits_tiles_in_memory_budget(tmpdir):
+    whole = run_member(default_config_filename, until=3)
+
+    # A budget of a few rows splits the 20-row domain into several tiles
+    assert tile_rows_for_budget(default_config_filename, 1 << 30) == 20
+    with pytest.raises(ValueError):
+        tile_rows_for_budget(default_config_filename, 1000)
+
+    paths = run_tiled(default_config_filename, 1200000, tmpdir, until=3)
+    assert tile_rows_for_budget(default_config_filename, 1200000) < 20
+    for name, values in whole["values"].items():
+        np.testing.assert_array_equal(np.load(paths[name]), values)
+
+
+def test_precomputed_outputs_take_tile_memory(tmpdir):
+    cfg_file = pathlib.Path(tmpdir) / "precompute.cfg"
+    cfg_file.write_text(
+        set_oldstyle_config_values(
+            default_config_filename.read_text(), {"precompute_outputs": "yes"}
+        )
+    )
+    # The series of every timestep leaves room for fewer rows
+    budget = 1200000
+    assert tile_rows_for_budget(cfg_file, budget) < tile_rows_for_budget(
+        default_config_filename, budget
+    )
+
+
+def test_tiles_use_temperature_file_override(tmpdir):
+    data_file = pathlib.Path(
+        pkg_resources.resource_filename("cru_alaska_temperature", "data")
+    ) / "cru_alaska_lowres_temperature.nc"
+    cfg_text = default_config_filename.read_text().replace(
+        "lowres", "highres"
+    )
+    cfg_file = pathlib.Path(tmpdir) / "highres.cfg"
+    cfg_file.write_text(cfg_text)
+    with pytest.raises(ValueError):
+        run_member(cfg_file, until=1)
+
+    # A relative temperature_file is relative to the config file
+    (pathlib.Path(tmpdir) / "data").mkdir()
+    (pathlib.Path(tmpdir) / "data" / "highres.nc").symlink_to(data_file)
+    cfg_file.write_text(
+        set_oldstyle_config_values(cfg_text, {"temperature_file": "data/highres.nc"})
+    )
+    cfg_files = write_tiled_config_files(cfg_file, 40, 10, pathlib.Path(tmpdir) / "t")
+    assert len(cfg_files) == 2
+    result = run_member(cfg_files[1], until=1)
+    assert all(values.shape == (10, 40) for values in result["values"].values())
@@ -0,0 +1,36 @@
+"""tests of the time it takes to import cru_alaska_temperature"""
+
+import pathlib
+import subprocess
+import sys
+
+# Generous enough for slow CI machines; pkg_resources alone used to take
+# most of it
+IMPORT_TIME_BUDGET = 2.0
+
+IMPORT_SCRIPT = """
+import sys
+import time
+
+started = time.perf_counter()
+import cru_alaska_temperature
+print(time.perf_counter() - started)
+print(" ".join(
+    name for name in ("netCDF4", "yaml", "dateutil", "pkg_resources")
+    if name in sys.modules
+))
+"""
+
+
+def test_import_defers_heavy_modules():
+    # A fresh interpreter, so that nothing is imported already
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=pathlib.Path(__file__).parents[1],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.splitlines()
+
+    assert float(output[0]) < IMPORT_TIME_BUDGET
+    assert output[1:] in ([], [""])